@@ -1,21 +1,53 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Form, Header, Query, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.formparsers import MultiPartParser
+from starlette.responses import JSONResponse, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from gridfs.errors import FileExists, NoFile
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import bson
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Any, NamedTuple, Tuple, Callable, Union
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import base64
 from google import genai
 from google.genai import types
-from PIL import Image
+from PIL import Image, ImageOps
 import io
 import json
+import re
 import asyncio
+import time
+import hashlib
+import gzip
+import argparse
+import shutil
+import tempfile
+from collections import defaultdict, OrderedDict, deque
+import copy
+import itertools
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from abc import ABC, abstractmethod
+import socket
+
+try:
+    import orjson
+except ImportError:  # Optional: FastJSONResponse falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional: responses are only gzip-compressed without it
+    brotli = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -52,56 +84,1135 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Model names
+DIAGNOSIS_MODEL = os.environ.get('DIAGNOSIS_MODEL', 'gemini-3-flash-preview')
+IMAGE_MODEL = os.environ.get('IMAGE_MODEL', 'imagen-4.0-generate-001')
+
+# Upstream concurrency: default in-flight limit per model, plus optional
+# per-model overrides, e.g. "imagen-4.0-generate-001=4,gemini-3-flash-preview=32"
+AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', '16'))
+AI_MODEL_CONCURRENCY = os.environ.get('AI_MODEL_CONCURRENCY', '')
+
+# Blob storage for image bytes: "gridfs" (default, works on stateless hosts) or "filesystem"
+BLOB_STORE = os.environ.get('BLOB_STORE', 'gridfs')
+BLOB_STORE_PATH = os.environ.get('BLOB_STORE_PATH', str(ROOT_DIR / 'blobs'))
+
+# Image serving: prefix for image URLs in payloads (empty = relative to the API host)
+# and the widths resized variants are snapped to
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
+IMAGE_VARIANT_WIDTHS = sorted(
+    int(w) for w in os.environ.get('IMAGE_VARIANT_WIDTHS', '150,300,600,800,1200').split(',') if w.strip().isdigit()
+)
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Uploads: hard cap enforced while the body streams in, size past which multipart
+# files spool to disk, and size past which videos go through the Gemini Files API
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(200 * 1024 * 1024)))
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', str(1024 * 1024)))
+UPLOAD_INLINE_MAX_BYTES = int(os.environ.get('UPLOAD_INLINE_MAX_BYTES', str(16 * 1024 * 1024)))
+# Uploaded photos are decoded in memory, so they get a much smaller limit than videos
+UPLOAD_IMAGE_MAX_BYTES = int(os.environ.get('UPLOAD_IMAGE_MAX_BYTES', str(25 * 1024 * 1024)))
+UPLOAD_LIMITED_PATHS = {"/api/diagnose", "/api/diagnose/stream", "/api/diagnose-upload"}
+
+# Starlette keeps multipart files in memory up to this size, then rolls them to disk
+MultiPartParser.max_file_size = UPLOAD_SPOOL_THRESHOLD
+
+# Video preprocessing (needs ffmpeg on PATH; falls back to sending the raw video)
+VIDEO_PREPROCESS = os.environ.get('VIDEO_PREPROCESS', 'true').lower() == 'true'
+VIDEO_KEYFRAME_FPS = float(os.environ.get('VIDEO_KEYFRAME_FPS', '0.5'))
+VIDEO_MAX_KEYFRAMES = int(os.environ.get('VIDEO_MAX_KEYFRAMES', '24'))
+VIDEO_KEYFRAME_MAX_EDGE = int(os.environ.get('VIDEO_KEYFRAME_MAX_EDGE', '768'))
+VIDEO_AUDIO_SAMPLE_RATE = int(os.environ.get('VIDEO_AUDIO_SAMPLE_RATE', '16000'))
+VIDEO_AUDIO_BITRATE = os.environ.get('VIDEO_AUDIO_BITRATE', '32k')
+VIDEO_PREPROCESS_TIMEOUT = float(os.environ.get('VIDEO_PREPROCESS_TIMEOUT', '120'))
+
+# CPU-bound PIL work runs in a process pool (0 = use a thread instead)
+IMAGE_PROCESS_WORKERS = int(os.environ.get('IMAGE_PROCESS_WORKERS', '2'))
+
+# Bump whenever the diagnosis prompt or response handling changes, so cached
+# analyses from the old prompt are not reused
+DIAGNOSIS_PROMPT_VERSION = "diagnosis-v4"
+
+# How many text-only repair round-trips to attempt when the diagnosis JSON is invalid
+DIAGNOSIS_REPAIR_ATTEMPTS = int(os.environ.get('DIAGNOSIS_REPAIR_ATTEMPTS', '2'))
+
+# Diagnosis cache: reuse an analysis for a near-identical photo + description
+DIAGNOSIS_CACHE_SIZE = int(os.environ.get('DIAGNOSIS_CACHE_SIZE', '256'))  # 0 disables
+DIAGNOSIS_CACHE_TTL = float(os.environ.get('DIAGNOSIS_CACHE_TTL', '3600'))
+DIAGNOSIS_CACHE_MAX_DISTANCE = int(os.environ.get('DIAGNOSIS_CACHE_MAX_DISTANCE', '4'))  # bits out of 64
+
+# Duplicate diagnose requests: how long a finished result is replayed to late retries
+DIAGNOSE_REPLAY_WINDOW = float(os.environ.get('DIAGNOSE_REPLAY_WINDOW', '300'))
+DIAGNOSE_REPLAY_SIZE = int(os.environ.get('DIAGNOSE_REPLAY_SIZE', '500'))
+
+# Gemini context caching for the static diagnosis prompt. Off by default: the
+# system prompt is only ~170 tokens, below Gemini's minimum cacheable size
+# (1,024+ tokens depending on the model), so creating the cache just fails and
+# costs a round trip. The response schema is generation config and cannot be
+# cached with it. Enable once the static prompt grows past the model's minimum.
+PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'false').lower() == 'true'
+PROMPT_CACHE_TTL = int(os.environ.get('PROMPT_CACHE_TTL', '3600'))
+PROMPT_CACHE_REFRESH_MARGIN = int(os.environ.get('PROMPT_CACHE_REFRESH_MARGIN', '300'))
+PROMPT_CACHE_RETRY_AFTER = int(os.environ.get('PROMPT_CACHE_RETRY_AFTER', '600'))  # after a failed create
+
+# Response compression: encodings in order of preference (br needs the brotli
+# package), bodies smaller than the minimum are sent as-is, and bodies past the
+# thread threshold are compressed off the event loop
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+COMPRESSION_ENCODINGS = [e.strip() for e in os.environ.get('COMPRESSION_ENCODINGS', 'br,gzip').split(',') if e.strip()]
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+COMPRESSION_THREAD_THRESHOLD = 256 * 1024
+
+# Background step-image jobs: worker count, how long a request waits inline for its
+# job, when a job without a heartbeat is considered abandoned, and how long finished
+# jobs are kept
+IMAGE_JOB_WORKERS = int(os.environ.get('IMAGE_JOB_WORKERS', '4'))
+IMAGE_JOB_WAIT_TIMEOUT = float(os.environ.get('IMAGE_JOB_WAIT_TIMEOUT', '120'))
+IMAGE_JOB_STALE_AFTER = float(os.environ.get('IMAGE_JOB_STALE_AFTER', '120'))
+IMAGE_JOB_RETENTION = int(os.environ.get('IMAGE_JOB_RETENTION', '86400'))
+IMAGE_JOB_POLL_INTERVAL = 5.0  # fallback re-read for jobs run by another process
+IMAGE_JOB_HEARTBEAT = 30.0  # running jobs refresh updated_at this often
+IMAGE_JOB_REAP_INTERVAL = 60.0  # how often abandoned jobs are looked for (and recovery retried)
+
+# Concurrent Imagen calls per bulk "generate all step images" request (the
+# per-model limit in AI_MODEL_CONCURRENCY still applies across requests)
+STEP_IMAGE_FANOUT = int(os.environ.get('STEP_IMAGE_FANOUT', '4'))
+
+# Speculative step images for new projects: how many leading steps to queue
+# (0 disables), a global budget in steps per hour, and the prefetch worker count
+IMAGE_PREFETCH_STEPS = int(os.environ.get('IMAGE_PREFETCH_STEPS', '0'))
+IMAGE_PREFETCH_BUDGET = int(os.environ.get('IMAGE_PREFETCH_BUDGET', '60'))
+IMAGE_PREFETCH_WORKERS = int(os.environ.get('IMAGE_PREFETCH_WORKERS', '1'))
+IMAGE_PREFETCH_BACKOFF = 1.0  # seconds between checks while interactive jobs are waiting
+
+# Generated step images shared across projects. Policy "context" reuses an image
+# for the same step title + hint on the same kind of hardware, "generic" ignores
+# the hardware, "off" disables; the byte budget is enforced least-recently-used first
+STEP_IMAGE_CACHE_POLICY = os.environ.get('STEP_IMAGE_CACHE_POLICY', 'context').lower()
+STEP_IMAGE_CACHE_MAX_BYTES = int(os.environ.get('STEP_IMAGE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# ============ Metrics ============
+
+class Metrics:
+    """In-process counters, gauges and timings exposed via /api/metrics"""
+
+    def __init__(self):
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        self.counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a sample (seconds, bytes, ratio...) as count/sum/max"""
+        timing = self.timings.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["sum"] += value
+        timing["max"] = max(timing["max"], value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "timings": {
+                name: {**t, "avg": t["sum"] / t["count"] if t["count"] else 0.0}
+                for name, t in self.timings.items()
+            },
+        }
+
+metrics = Metrics()
+
+# ============ AI Gateway ============
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    """Parse "model=limit,model=limit" into a dict, ignoring malformed entries"""
+    limits = {}
+    for entry in spec.split(","):
+        name, _, value = entry.strip().partition("=")
+        if name and value.strip().isdigit():
+            limits[name.strip()] = max(1, int(value))
+    return limits
+
+class AIGateway:
+    """Single entry point for Gemini/Imagen calls.
+
+    Calls go through the SDK's async client so a 5-30s model round-trip never
+    blocks the event loop, and each model gets its own semaphore so a burst of
+    diagnoses queues here instead of overrunning the upstream quota.
+    """
+
+    def __init__(self, genai_client, default_limit: int, model_limits: Dict[str, int]):
+        self.client = genai_client
+        self.default_limit = max(1, default_limit)
+        self.model_limits = model_limits
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting: Dict[str, int] = defaultdict(int)
+        self._in_flight: Dict[str, int] = defaultdict(int)
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    def limit_for(self, model: str) -> int:
+        return self.model_limits.get(model, self.default_limit)
+
+    def _publish(self, model: str) -> None:
+        metrics.set_gauge(f"ai.{model}.waiting", self._waiting[model])
+        metrics.set_gauge(f"ai.{model}.in_flight", self._in_flight[model])
+
+    @asynccontextmanager
+    async def _slot(self, model: str):
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = self._semaphores[model] = asyncio.Semaphore(self.limit_for(model))
+
+        self._waiting[model] += 1
+        self._publish(model)
+        queued_at = time.monotonic()
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[model] -= 1
+        metrics.observe(f"ai.{model}.queue_wait_seconds", time.monotonic() - queued_at)
+
+        self._in_flight[model] += 1
+        self._publish(model)
+        started_at = time.monotonic()
+        try:
+            yield
+        except Exception:
+            metrics.incr(f"ai.{model}.errors")
+            raise
+        finally:
+            self._in_flight[model] -= 1
+            semaphore.release()
+            self._publish(model)
+            metrics.incr(f"ai.{model}.requests")
+            metrics.observe(f"ai.{model}.latency_seconds", time.monotonic() - started_at)
+
+    def _require_client(self):
+        if not self.client:
+            raise ValueError("Google GenAI client not initialized. Check API keys.")
+        return self.client
+
+    async def generate_content(self, model: str, contents, config: Optional[types.GenerateContentConfig] = None):
+        client = self._require_client()
+        async with self._slot(model):
+            return await client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+    async def generate_images(self, model: str, prompt: str, config: Optional[types.GenerateImagesConfig] = None):
+        client = self._require_client()
+        async with self._slot(model):
+            return await client.aio.models.generate_images(model=model, prompt=prompt, config=config)
+
+    async def generate_content_stream(self, model: str, contents, config: Optional[types.GenerateContentConfig] = None):
+        """Stream response chunks; the concurrency slot is held until the stream ends"""
+        client = self._require_client()
+        async with self._slot(model):
+            async for chunk in await client.aio.models.generate_content_stream(model=model, contents=contents, config=config):
+                yield chunk
+
+    async def upload_file(self, path: str, mime_type: str, timeout: float = 300.0, poll_interval: float = 2.0):
+        """Upload a local file via the Files API and wait until it can be referenced"""
+        client = self._require_client()
+        async with self._slot("files"):
+            uploaded = await client.aio.files.upload(file=path, config=types.UploadFileConfig(mime_type=mime_type))
+            deadline = time.monotonic() + timeout
+            while uploaded.state and uploaded.state.name == "PROCESSING":
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"File {uploaded.name} still processing after {timeout:.0f}s")
+                await asyncio.sleep(poll_interval)
+                uploaded = await client.aio.files.get(name=uploaded.name)
+            if uploaded.state and uploaded.state.name == "FAILED":
+                raise ValueError(f"File processing failed for {uploaded.name}")
+            return uploaded
+
+    async def delete_file(self, name: str) -> None:
+        try:
+            await self._require_client().aio.files.delete(name=name)
+        except Exception as e:
+            logger.warning(f"Failed to delete uploaded file {name}: {str(e)}")
+
+    async def create_cache(self, model: str, system_instruction: str, ttl_seconds: int):
+        client = self._require_client()
+        return await client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                ttl=f"{ttl_seconds}s",
+            )
+        )
+
+    async def extend_cache(self, name: str, ttl_seconds: int):
+        client = self._require_client()
+        return await client.aio.caches.update(
+            name=name,
+            config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s")
+        )
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            model: {
+                "limit": self.limit_for(model),
+                "in_flight": self._in_flight[model],
+                "waiting": self._waiting[model],
+            }
+            for model in self._semaphores
+        }
+
+ai_gateway = AIGateway(client_genai, AI_MAX_CONCURRENCY, parse_model_limits(AI_MODEL_CONCURRENCY))
+
 # ============ Models ============
 
 class DiagnosisRequest(BaseModel):
     image_base64: str
     description: Optional[str] = ""
 
-class MaterialTool(BaseModel):
+# Fields the diagnosis fills in, shared by the stored models and the diagnosis
+# response schema (DiagnosisAnalysis). Field descriptions are sent to the model.
+
+class ItemBase(BaseModel):
+    name: str = Field(description="Material or tool name")
+    estimated_cost: Optional[str] = Field(default=None, description="$X-Y, 'included', 'varies' or 'common household item'")
+
+class StepBase(BaseModel):
+    step_number: int
+    title: str = Field(description="Step title")
+    description: str = Field(description="Detailed step description with micro-steps. Include conditional logic like 'If X, then do Y, otherwise do Z'")
+    warning: Optional[str] = Field(default=None, description="Optional safety warning for this specific step")
+    image_hint: Optional[str] = Field(default=None, description="Brief description of what to look for or how to position (for AR overlay)")
+
+class ProjectBase(BaseModel):
+    title: str = Field(description="Brief descriptive title of the repair (e.g., 'Fix Leaky Moen Kitchen Faucet')")
+    hardware_identified: str = Field(description="Specific hardware/material identified (brand, model if visible)")
+    issue_type: str = Field(description="Type of damage or issue identified")
+    description: str = Field(description="Detailed description of the problem and what needs to be fixed")
+    skill_level: int = Field(description="1=Novice: no power tools, <30min | 2=Beginner: basic tools, 1-2hrs | 3=Intermediate: power tools, potential risks | 4=Expert: permits/specialized knowledge")
+    estimated_time: str = Field(description="Time estimate (e.g., '30 minutes', '2-3 hours')")
+    safety_warnings: List[str] = Field(default=[], description="List of important safety warnings")
+
+class MaterialTool(ItemBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
     category: str  # "material" or "tool"
-    estimated_cost: Optional[str] = None
     already_owned: bool = False
 
-class InstructionStep(BaseModel):
+class InstructionStep(StepBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    step_number: int
-    title: str
-    description: str
-    warning: Optional[str] = None
-    image_hint: Optional[str] = None
-    generated_images: List[str] = []  # Base64 encoded AI-generated images
+    generated_images: List[str] = []  # Base64 encoded AI-generated images (legacy / response only)
+    generated_image_refs: List[str] = []  # Blob hashes of AI-generated images
+    generated_image_urls: List[str] = []  # Response only: /api/images URLs for generated_image_refs
+    has_images: bool = False  # Response only: generated images are available
     images_generating: bool = False   # Flag to show loading state
 
-class Project(BaseModel):
+class Project(ProjectBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    title: str
-    description: str
-    skill_level: int  # 1-4
     skill_level_name: str  # "Novice", "Beginner", "Intermediate", "Expert"
-    estimated_time: str
-    image_base64: str
+    image_base64: str = ""  # Legacy inline image / response only
     thumbnail_base64: Optional[str] = "" # For list view
-    hardware_identified: str
-    issue_type: str
+    image_ref: Optional[str] = None  # Blob hash of the original image
+    thumbnail_ref: Optional[str] = None  # Blob hash of the thumbnail
+    image_url: Optional[str] = None  # Response only: /api/images URL for image_ref
+    thumbnail_url: Optional[str] = None  # Response only: /api/images URL for thumbnail_ref
     steps: List[InstructionStep]
     materials: List[MaterialTool]
     tools: List[MaterialTool]
-    safety_warnings: List[str] = []
+    version: int = 1  # Bumped by every write; part of the project's ETag
+    image_context: Optional[str] = None  # Visual description of the source media, reused for step images
+    image_context_ref: Optional[str] = None  # image_ref that image_context was computed from
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ProjectResponse(BaseModel):
     project: Project
 
+class ProjectSummary(BaseModel):
+    """Card fields for history/home lists"""
+    id: str
+    title: str
+    description: str
+    skill_level: int
+    skill_level_name: str
+    estimated_time: str
+    hardware_identified: str
+    issue_type: str
+    thumbnail_ref: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    thumbnail_base64: Optional[str] = ""  # Legacy inline thumbnail for older projects
+    created_at: datetime
+
 class ProjectListResponse(BaseModel):
-    projects: List[Project]
+    projects: List[ProjectSummary]
+    next_cursor: Optional[str] = None  # Pass as ?before= to fetch the next page
 
 class ToggleItemRequest(BaseModel):
     item_id: str
     owned: bool
 
+class UpdateItemsRequest(BaseModel):
+    items: List[ToggleItemRequest]
+
+class ItemOutcome(BaseModel):
+    item_id: str
+    found: bool
+    owned: Optional[bool] = None  # Stored value after the update
+
+class UpdateItemsResponse(BaseModel):
+    success: bool  # Every item was found
+    items: List[ItemOutcome]
+
+# Response schema for the diagnosis prompt: the AI-filled subset of
+# Project / InstructionStep / MaterialTool, built from the same bases
+
+class DiagnosisAnalysis(ProjectBase):
+    steps: List[StepBase]
+    materials: List[ItemBase]
+    tools: List[ItemBase]
+    visual_context: Optional[str] = Field(default=None, description="Under 100 words describing the pictured hardware/fixture (style, color, material), the setting (bathroom, kitchen, etc.), visible damage and surroundings")
+
+# ============ Blob Store ============
+
+class Blob(NamedTuple):
+    data: bytes
+    content_type: str
+
+def blob_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class BlobStore(ABC):
+    """Content-addressed storage for raw image bytes.
+
+    Blobs are keyed by the sha256 of their content, so storing the same bytes
+    twice is a no-op and projects only need to keep the hash.
+    """
+
+    @abstractmethod
+    async def put(self, data: bytes, content_type: str) -> str:
+        ...
+
+    @abstractmethod
+    async def get(self, blob_id: str) -> Optional[Blob]:
+        ...
+
+    @abstractmethod
+    async def exists(self, blob_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, blob_id: str) -> None:
+        ...
+
+class GridFSBlobStore(BlobStore):
+    """Blob store backed by MongoDB GridFS, using the content hash as file id"""
+
+    def __init__(self, database, bucket_name: str = "blobs"):
+        self.files = database[f"{bucket_name}.files"]
+        self.bucket = AsyncIOMotorGridFSBucket(database, bucket_name=bucket_name)
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        blob_id = blob_hash(data)
+        if await self.exists(blob_id):
+            metrics.incr("blobs.deduplicated")
+            return blob_id
+        try:
+            await self.bucket.upload_from_stream_with_id(
+                blob_id, blob_id, data, metadata={"content_type": content_type}
+            )
+            metrics.incr("blobs.stored")
+            metrics.incr("blobs.stored_bytes", len(data))
+        except FileExists:
+            # A concurrent request stored the same content first
+            metrics.incr("blobs.deduplicated")
+        return blob_id
+
+    async def get(self, blob_id: str) -> Optional[Blob]:
+        try:
+            grid_out = await self.bucket.open_download_stream(blob_id)
+        except NoFile:
+            return None
+        data = await grid_out.read()
+        content_type = (grid_out.metadata or {}).get("content_type", "application/octet-stream")
+        return Blob(data, content_type)
+
+    async def exists(self, blob_id: str) -> bool:
+        return await self.files.find_one({"_id": blob_id}, {"_id": 1}) is not None
+
+    async def delete(self, blob_id: str) -> None:
+        try:
+            await self.bucket.delete(blob_id)
+        except NoFile:
+            pass
+
+class FileSystemBlobStore(BlobStore):
+    """Blob store on local disk: <root>/<hash[:2]>/<hash> plus a .type sidecar"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, blob_id: str) -> Path:
+        if len(blob_id) != 64 or any(c not in "0123456789abcdef" for c in blob_id):
+            raise ValueError(f"Invalid blob id: {blob_id}")
+        return self.root / blob_id[:2] / blob_id
+
+    def _write(self, path: Path, data: bytes, content_type: str) -> bool:
+        if path.exists():
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        path.with_suffix(".type").write_text(content_type)
+        os.replace(tmp_path, path)
+        return True
+
+    def _read(self, path: Path) -> Optional[Blob]:
+        if not path.exists():
+            return None
+        type_path = path.with_suffix(".type")
+        content_type = type_path.read_text() if type_path.exists() else "application/octet-stream"
+        return Blob(path.read_bytes(), content_type)
+
+    def _remove(self, path: Path) -> None:
+        for target in (path, path.with_suffix(".type")):
+            target.unlink(missing_ok=True)
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        blob_id = blob_hash(data)
+        if await asyncio.to_thread(self._write, self._path(blob_id), data, content_type):
+            metrics.incr("blobs.stored")
+            metrics.incr("blobs.stored_bytes", len(data))
+        else:
+            metrics.incr("blobs.deduplicated")
+        return blob_id
+
+    async def get(self, blob_id: str) -> Optional[Blob]:
+        try:
+            path = self._path(blob_id)
+        except ValueError:
+            return None
+        return await asyncio.to_thread(self._read, path)
+
+    async def exists(self, blob_id: str) -> bool:
+        try:
+            path = self._path(blob_id)
+        except ValueError:
+            return False
+        return await asyncio.to_thread(path.exists)
+
+    async def delete(self, blob_id: str) -> None:
+        await asyncio.to_thread(self._remove, self._path(blob_id))
+
+def create_blob_store() -> BlobStore:
+    if BLOB_STORE == "filesystem":
+        return FileSystemBlobStore(BLOB_STORE_PATH)
+    return GridFSBlobStore(db)
+
+blob_store = create_blob_store()
+
+def decode_data_url(data: str, default_type: str = "image/jpeg") -> Blob:
+    """Decode a base64 string, with or without a data: URL prefix"""
+    content_type = default_type
+    if "base64," in data:
+        prefix, data = data.split("base64,", 1)
+        if prefix.startswith("data:") and prefix[5:].rstrip(";"):
+            content_type = prefix[5:].rstrip(";")
+    return Blob(base64.b64decode(data), content_type)
+
+def image_url(blob_id: Optional[str], width: Optional[int] = None) -> Optional[str]:
+    if not blob_id:
+        return None
+    url = f"{PUBLIC_BASE_URL}/api/images/{blob_id}"
+    return f"{url}?w={width}" if width else url
+
+async def load_project_image(project_data: Dict) -> Optional[Blob]:
+    """Original image bytes for a project, from the blob store or a legacy inline field"""
+    if project_data.get("image_ref"):
+        return await blob_store.get(project_data["image_ref"])
+    if project_data.get("image_base64"):
+        return decode_data_url(project_data["image_base64"])
+    return None
+
+# Top-level fields step image generation needs; everything else (the legacy
+# inline original in particular) stays in MongoDB
+STEP_IMAGE_PROJECT_FIELDS = ("title", "hardware_identified", "image_ref", "image_context", "image_context_ref")
+
+async def find_project_step(project_id: str, step_id: str, fields=(), collection=None) -> Tuple[Dict, Dict]:
+    """(project fields, step) for one step, without reading the rest of the document"""
+    collection = db.projects if collection is None else collection
+    projection = {"_id": 0, "id": 1, **{field: 1 for field in fields}, "steps": {"$elemMatch": {"id": step_id}}}
+    project_data = await collection.find_one({"id": project_id}, projection)
+    if not project_data:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if not project_data.get("steps"):
+        raise HTTPException(status_code=404, detail="Step not found")
+    return project_data, project_data["steps"][0]
+
+def project_blob_refs(project_data: Dict) -> List[str]:
+    refs = [project_data.get("image_ref"), project_data.get("thumbnail_ref")]
+    for step in project_data.get("steps", []):
+        refs.extend(step.get("generated_image_refs", []))
+    return [ref for ref in dict.fromkeys(refs) if ref]
+
+def attach_image_urls(project_data: Dict) -> Dict:
+    """Expose blob refs as /api/images URLs so payloads carry links, not pixels"""
+    project_data["image_url"] = image_url(project_data.get("image_ref"))
+    project_data["thumbnail_url"] = image_url(project_data.get("thumbnail_ref"))
+    for step in project_data.get("steps", []):
+        step["generated_image_urls"] = [image_url(ref) for ref in step.get("generated_image_refs", [])]
+        step["has_images"] = bool(step["generated_image_urls"] or step.get("generated_images"))
+    return project_data
+
+def step_image_urls(step_data: Dict) -> List[str]:
+    """Image URLs for a step, falling back to legacy inline base64 images"""
+    if step_data.get("generated_image_refs"):
+        return [image_url(ref) for ref in step_data["generated_image_refs"]]
+    return step_data.get("generated_images", [])
+
+# Project detail reads: pixels are served by /api/images, never inlined
+PROJECT_DETAIL_PROJECTION = {"_id": 0, "image_base64": 0, "thumbnail_base64": 0, "steps.generated_images": 0}
+
+# Projects from before the blob store that still carry inline base64 images
+LEGACY_INLINE_IMAGES_FILTER = {"$or": [
+    {"image_base64": {"$exists": True, "$nin": ["", None]}},
+    {"thumbnail_base64": {"$exists": True, "$nin": ["", None]}},
+    {"steps.generated_images.0": {"$exists": True}},
+]}
+
+async def migrate_inline_images(project_id: str) -> bool:
+    """Move a legacy project's inline base64 images into the blob store as refs.
+
+    Either way the project is marked inline_images_checked (a stored-only flag),
+    so reads skip the check from then on.
+    """
+    project_data = await db.projects.find_one({"id": project_id, **LEGACY_INLINE_IMAGES_FILTER})
+    if not project_data:
+        await db.projects.update_one({"id": project_id}, {"$set": {"inline_images_checked": True}})
+        return False
+
+    updates: Dict[str, Any] = {}
+    removals: Dict[str, str] = {}
+    for field, ref_field in (("image_base64", "image_ref"), ("thumbnail_base64", "thumbnail_ref")):
+        if project_data.get(field):
+            if not project_data.get(ref_field):
+                blob = decode_data_url(project_data[field])
+                updates[ref_field] = await blob_store.put(blob.data, blob.content_type)
+            removals[field] = ""
+    for index, step in enumerate(project_data.get("steps", [])):
+        if step.get("generated_images"):
+            if not step.get("generated_image_refs"):
+                refs = []
+                for image in step["generated_images"]:
+                    blob = decode_data_url(image)
+                    refs.append(await blob_store.put(blob.data, blob.content_type))
+                updates[f"steps.{index}.generated_image_refs"] = refs
+            removals[f"steps.{index}.generated_images"] = ""
+
+    update: Dict[str, Any] = {
+        "$set": {**updates, "inline_images_checked": True}, "$unset": removals, "$inc": {"version": 1}
+    }
+    await db.projects.update_one({"id": project_id}, update)
+    await bump_projects_version()
+    metrics.incr("projects.inline_images_migrated")
+    logger.info(f"Moved inline images of project {project_id} to the blob store")
+    return True
+
+async def release_blobs(blob_ids: List[str]) -> None:
+    """Delete blobs that no remaining project or step image cache entry references"""
+    for blob_id in blob_ids:
+        still_used = await db.projects.find_one(
+            {"$or": [
+                {"image_ref": blob_id},
+                {"thumbnail_ref": blob_id},
+                {"steps.generated_image_refs": blob_id},
+            ]},
+            {"_id": 1}
+        ) or await db.step_image_cache.find_one({"blob_id": blob_id}, {"_id": 1})
+        if not still_used:
+            await blob_store.delete(blob_id)
+            async for variant in db.image_variants.find({"source": blob_id}):
+                await blob_store.delete(variant["blob_id"])
+            await db.image_variants.delete_many({"source": blob_id})
+
+# ============ Project List Pagination ============
+
+PROJECTS_PAGE_SIZE = int(os.environ.get('PROJECTS_PAGE_SIZE', '50'))
+PROJECT_SUMMARY_PROJECTION = {"_id": 0, **{field: 1 for field in ProjectSummary.__fields__ if field != "thumbnail_url"}}
+
+def encode_project_cursor(created_at: datetime, project_id: str) -> str:
+    payload = json.dumps({"created_at": created_at.isoformat(), "id": project_id})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_project_cursor(cursor: str) -> Dict:
+    """Turn a ?before= cursor into a filter for projects strictly older than it"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        created_at = datetime.fromisoformat(payload["created_at"])
+        project_id = str(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": project_id}},
+    ]}
+
+# ============ Fast JSON Responses ============
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed.
+
+    Endpoints that return it hand over plain dicts (see trusted_payload), so
+    FastAPI skips response-model validation and jsonable_encoder entirely.
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def trusted_payload(model, document: Dict) -> Dict:
+    """A document this app wrote, shaped like `model` (its fields, defaults filled
+    in, extra keys dropped) without running validation"""
+    payload = {}
+    for name, field in model.__fields__.items():
+        if name in document:
+            payload[name] = document[name]
+        else:
+            payload[name] = None if field.is_required() else field.get_default(call_default_factory=True)
+    return payload
+
+def project_payload(project_data: Dict) -> Dict:
+    payload = trusted_payload(Project, attach_image_urls(project_data))
+    payload["steps"] = [trusted_payload(InstructionStep, step) for step in payload["steps"] or []]
+    payload["materials"] = [trusted_payload(MaterialTool, item) for item in payload["materials"] or []]
+    payload["tools"] = [trusted_payload(MaterialTool, item) for item in payload["tools"] or []]
+    return payload
+
+# ============ Versions & ETags ============
+
+# Bump when project payloads change shape so clients drop copies cached under old ETags
+PROJECT_PAYLOAD_REVISION = "1"
+
+async def bump_projects_version() -> None:
+    """Collection-level version for the project list: bumped on insert, delete and card changes"""
+    await db.collection_versions.update_one({"_id": "projects"}, {"$inc": {"version": 1}}, upsert=True)
+
+async def projects_version() -> int:
+    document = await db.collection_versions.find_one({"_id": "projects"})
+    return document.get("version", 0) if document else 0
+
+def version_etag(*parts) -> str:
+    """ETag for a versioned payload; also changes with the payload revision and image URL prefix"""
+    key = "|".join(str(part) for part in (PROJECT_PAYLOAD_REVISION, PUBLIC_BASE_URL, *parts))
+    return f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+def versioned_headers(etag: str) -> Dict[str, str]:
+    # no-cache: clients may keep the payload but must revalidate it every time
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+# ============ Index Management ============
+
+# Reconcile declared indexes on startup (set to "false" to manage them out of band)
+MANAGE_INDEXES = os.environ.get('MANAGE_INDEXES', 'true').lower() == 'true'
+
+REQUIRED_INDEXES = {
+    "projects": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_desc_id_desc"),
+        IndexModel([("steps.id", ASCENDING)], name="steps_id"),
+        IndexModel([("materials.id", ASCENDING)], name="materials_id"),
+        IndexModel([("tools.id", ASCENDING)], name="tools_id"),
+        # Blob reference lookups when releasing blobs on delete
+        IndexModel([("image_ref", ASCENDING)], name="image_ref"),
+        IndexModel([("thumbnail_ref", ASCENDING)], name="thumbnail_ref"),
+        IndexModel([("steps.generated_image_refs", ASCENDING)], name="steps_generated_image_refs"),
+    ],
+    "image_variants": [
+        IndexModel([("source", ASCENDING), ("width", ASCENDING), ("format", ASCENDING)],
+                   name="source_width_format", unique=True),
+    ],
+    "step_image_cache": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        IndexModel([("last_used_at", ASCENDING)], name="last_used_at"),
+        IndexModel([("blob_id", ASCENDING)], name="blob_id"),
+    ],
+    "image_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # At most one queued/running job per step
+        IndexModel([("project_id", ASCENDING), ("step_id", ASCENDING)], name="project_step_active",
+                   unique=True, partialFilterExpression={"active": True}),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=IMAGE_JOB_RETENTION),
+    ],
+}
+
+def index_spec(document: Dict) -> Dict:
+    """The parts of an index definition that matter when comparing declared vs existing"""
+    return {
+        "key": [tuple(k) for k in (document["key"].items() if hasattr(document["key"], "items") else document["key"])],
+        "unique": bool(document.get("unique", False)),
+        "sparse": bool(document.get("sparse", False)),
+        "expireAfterSeconds": document.get("expireAfterSeconds"),
+        "partialFilterExpression": dict(document.get("partialFilterExpression") or {}),
+    }
+
+async def ensure_indexes(dry_run: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    """Create missing declared indexes and report missing/extra/conflicting ones.
+
+    Extra indexes are only logged, never dropped. Conflicting definitions (same
+    name, different keys or options) are left alone for an operator to resolve.
+    """
+    report = {}
+    for collection_name, declared in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        declared_by_name = {model.document["name"]: model for model in declared}
+
+        missing = [name for name in declared_by_name if name not in existing]
+        conflicting = [
+            name for name, model in declared_by_name.items()
+            if name in existing and index_spec(model.document) != index_spec(existing[name])
+        ]
+        extra = [name for name in existing if name != "_id_" and name not in declared_by_name]
+
+        for name in missing:
+            logger.warning(f"Index {collection_name}.{name} is missing" + (" (dry run)" if dry_run else ", creating"))
+        for name in conflicting:
+            logger.warning(f"Index {collection_name}.{name} exists with a different definition: {existing[name]}")
+        for name in extra:
+            logger.info(f"Index {collection_name}.{name} is not declared by the application")
+
+        if missing and not dry_run:
+            await collection.create_indexes([declared_by_name[name] for name in missing])
+
+        report[collection_name] = {"missing": missing, "conflicting": conflicting, "extra": extra}
+    return report
+
+# ============ Image Processing ============
+# Functions in this section run in worker processes: keep them top-level and
+# limited to bytes in / bytes out.
+
+# Pre-model transform: what Gemini receives instead of the full-resolution photo
+MODEL_IMAGE_TRANSFORM = os.environ.get('MODEL_IMAGE_TRANSFORM', 'true').lower() == 'true'
+MODEL_IMAGE_MAX_EDGE = int(os.environ.get('MODEL_IMAGE_MAX_EDGE', '1536'))
+MODEL_IMAGE_FORMAT = os.environ.get('MODEL_IMAGE_FORMAT', 'jpeg').lower()  # "jpeg" or "webp"
+if MODEL_IMAGE_FORMAT not in ("jpeg", "webp"):
+    raise ValueError(f"MODEL_IMAGE_FORMAT must be 'jpeg' or 'webp', got {MODEL_IMAGE_FORMAT!r}")
+MODEL_IMAGE_QUALITY = int(os.environ.get('MODEL_IMAGE_QUALITY', '85'))
+MODEL_IMAGE_STRIP_METADATA = os.environ.get('MODEL_IMAGE_STRIP_METADATA', 'true').lower() == 'true'
+
+THUMBNAIL_SIZE = (300, 300)
+EXIF_ORIENTATION = 0x0112
+
+class IngestedImage(NamedTuple):
+    original: bytes  # Upload bytes, re-encoded only if EXIF orientation had to be applied
+    original_type: str
+    model_image: bytes  # What the model receives (see MODEL_IMAGE_* settings)
+    model_type: str
+    thumbnail: bytes  # JPEG, within THUMBNAIL_SIZE
+    phash: int  # 64-bit difference hash of the oriented image
+
+def encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    buffered = io.BytesIO()
+    img.convert("RGB").save(buffered, format="JPEG", quality=quality, optimize=True)
+    return buffered.getvalue()
+
+def encode_model_image(img: Image.Image) -> Tuple[bytes, str]:
+    """Downscale and re-encode for the model; PIL drops EXIF/ICC unless passed through.
+    Returns the bytes and their content type."""
+    img = img.copy()
+    img.thumbnail((MODEL_IMAGE_MAX_EDGE, MODEL_IMAGE_MAX_EDGE), Image.Resampling.LANCZOS)
+    metadata = {}
+    if not MODEL_IMAGE_STRIP_METADATA:
+        metadata = {key: img.info[key] for key in ("exif", "icc_profile") if img.info.get(key)}
+    buffered = io.BytesIO()
+    if MODEL_IMAGE_FORMAT == "webp":
+        img.save(buffered, format="WEBP", quality=MODEL_IMAGE_QUALITY, **metadata)
+        return buffered.getvalue(), "image/webp"
+    img.convert("RGB").save(buffered, format="JPEG", quality=MODEL_IMAGE_QUALITY, optimize=True, **metadata)
+    return buffered.getvalue(), "image/jpeg"
+
+def difference_hash(img: Image.Image) -> int:
+    """64-bit dHash: robust to re-compression, resizing and small exposure changes"""
+    pixels = list(img.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def ingest_image(data: bytes, content_type: str) -> IngestedImage:
+    """Decode an upload once and derive everything the diagnosis needs from it"""
+    img = Image.open(io.BytesIO(data))
+    img.load()
+
+    original, original_type = data, content_type
+    if img.getexif().get(EXIF_ORIENTATION, 1) != 1:
+        img = ImageOps.exif_transpose(img)
+        original, original_type = encode_jpeg(img, 90), "image/jpeg"
+
+    if MODEL_IMAGE_TRANSFORM:
+        model_image, model_type = encode_model_image(img)
+    else:
+        model_image, model_type = original, original_type
+
+    phash = difference_hash(img)
+    img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    return IngestedImage(original, original_type, model_image, model_type, encode_jpeg(img, 70), phash)
+
+def render_image_variant(data: bytes, width: Optional[int], image_format: str) -> bytes:
+    """Resize to the given width (never upscaling; None keeps the source width) and re-encode"""
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if width and img.width > width:
+        img.thumbnail((width, img.height), Image.Resampling.LANCZOS)
+    if image_format == "webp":
+        buffered = io.BytesIO()
+        img.save(buffered, format="WEBP", quality=80)
+        return buffered.getvalue()
+    return encode_jpeg(img, 80)
+
+def encode_generated_image(data: bytes) -> bytes:
+    """Shrink an Imagen result for mobile and re-encode as JPEG"""
+    img = Image.open(io.BytesIO(data))
+    img.thumbnail((800, 600), Image.Resampling.LANCZOS)
+    return encode_jpeg(img, 80)
+
+image_pool: Optional[ProcessPoolExecutor] = None
+
+# Workers must not be forked from a process already running motor and to_thread threads
+IMAGE_POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+async def run_image_job(func, *args):
+    """Run CPU-bound image work off the event loop.
+
+    If a worker dies (e.g. OOM-killed on a huge photo) the pool is broken for
+    good, so it is replaced and the job retried once; a second failure raises
+    BrokenProcessPool, which callers must treat as a server error.
+    """
+    global image_pool
+    if IMAGE_PROCESS_WORKERS <= 0:
+        return await asyncio.to_thread(func, *args)
+    started_at = time.monotonic()
+    for attempt in range(2):
+        if image_pool is None:
+            image_pool = ProcessPoolExecutor(max_workers=IMAGE_PROCESS_WORKERS, mp_context=IMAGE_POOL_CONTEXT)
+        pool = image_pool
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+            break
+        except BrokenProcessPool:
+            metrics.incr("images.pool_broken")
+            logger.error(f"Image worker pool broke during {func.__name__}, replacing it")
+            if image_pool is pool:  # Concurrent jobs on the same pool replace it only once
+                image_pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            if attempt:
+                raise
+    metrics.observe(f"images.{func.__name__}_seconds", time.monotonic() - started_at)
+    return result
+
+async def ingest_upload(data: bytes, content_type: str) -> IngestedImage:
+    """Run ingest_image and report what the pre-model transform saved"""
+    started_at = time.monotonic()
+    ingested = await run_image_job(ingest_image, data, content_type)
+    elapsed = time.monotonic() - started_at
+
+    bytes_saved = len(data) - len(ingested.model_image)
+    metrics.incr("model_media.bytes_in", len(data))
+    metrics.incr("model_media.bytes_out", len(ingested.model_image))
+    metrics.observe("model_media.bytes_saved", bytes_saved)
+    metrics.observe("model_media.ingest_seconds", elapsed)
+    logger.info(
+        f"Ingested image: {len(data)} -> {len(ingested.model_image)} bytes for model "
+        f"({bytes_saved} saved, transform={'on' if MODEL_IMAGE_TRANSFORM else 'off'}, {elapsed * 1000:.0f} ms)"
+    )
+    return ingested
+
+async def ingest_or_400(data: Union[str, bytes], content_type: str = "") -> IngestedImage:
+    """ingest_upload for client input: a data URL, or raw bytes of content_type.
+    Undecodable images are the client's fault (400); a broken worker pool is not."""
+    try:
+        if isinstance(data, str):
+            upload = decode_data_url(data)
+            data, content_type = upload.data, upload.content_type
+        return await ingest_upload(data, content_type)
+    except BrokenProcessPool:
+        raise  # Our image workers failed, not the client's image
+    except Exception as img_err:
+        logger.error(f"Image processing error: {img_err}")
+        raise HTTPException(status_code=400, detail="Invalid image data")
+
+# ============ Image Variants ============
+
+def snap_variant_width(width: int) -> int:
+    """Round a requested width up to the nearest configured variant width"""
+    for candidate in IMAGE_VARIANT_WIDTHS:
+        if candidate >= width:
+            return candidate
+    return IMAGE_VARIANT_WIDTHS[-1] if IMAGE_VARIANT_WIDTHS else width
+
+async def get_image_variant(blob_id: str, width: Optional[int], image_format: str) -> Optional[Blob]:
+    """Fetch a resized (or, with width None, only re-encoded) variant, rendering and
+    storing it on first request"""
+    key = {"source": blob_id, "width": width, "format": image_format}
+    variant = await db.image_variants.find_one(key)
+    if variant:
+        blob = await blob_store.get(variant["blob_id"])
+        if blob:
+            metrics.incr("images.variant_hits")
+            return blob
+
+    source = await blob_store.get(blob_id)
+    if not source:
+        return None
+    metrics.incr("images.variant_renders")
+    data = await run_image_job(render_image_variant, source.data, width, image_format)
+    blob = Blob(data, f"image/{image_format}")
+    variant_id = await blob_store.put(blob.data, blob.content_type)
+    await db.image_variants.update_one(key, {"$set": {"blob_id": variant_id}}, upsert=True)
+    return blob
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+# ============ Diagnosis Cache ============
+
+def normalize_description(description: str) -> str:
+    return " ".join((description or "").lower().split())
+
+class DiagnosisCache:
+    """LRU + TTL cache of analyses keyed by perceptual image hash.
+
+    Entries are grouped by (description, model, prompt version); within a group
+    a lookup matches any image whose hash is within max_distance bits.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_distance: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # (context, phash) -> (stored_at, analysis)
+
+    @staticmethod
+    def context_key(description: str) -> tuple:
+        return (normalize_description(description), DIAGNOSIS_MODEL, DIAGNOSIS_PROMPT_VERSION)
+
+    def get(self, phash: int, description: str) -> Optional[Dict]:
+        if self.max_entries <= 0:
+            return None
+        context = self.context_key(description)
+        now = time.monotonic()
+        best_key, best_distance = None, self.max_distance + 1
+        for key, (stored_at, _) in list(self._entries.items()):
+            if now - stored_at > self.ttl:
+                del self._entries[key]
+                continue
+            if key[0] == context:
+                distance = (key[1] ^ phash).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+
+        if best_key is None:
+            metrics.incr("diagnosis_cache.misses")
+            return None
+        self._entries.move_to_end(best_key)
+        metrics.incr("diagnosis_cache.hits")
+        return copy.deepcopy(self._entries[best_key][1])
+
+    def put(self, phash: int, description: str, analysis: Dict) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (self.context_key(description), phash)
+        self._entries[key] = (time.monotonic(), copy.deepcopy(analysis))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            metrics.incr("diagnosis_cache.evictions")
+        metrics.set_gauge("diagnosis_cache.entries", len(self._entries))
+
+diagnosis_cache = DiagnosisCache(DIAGNOSIS_CACHE_SIZE, DIAGNOSIS_CACHE_TTL, DIAGNOSIS_CACHE_MAX_DISTANCE)
+
+# ============ Request Coalescing ============
+
+class SingleFlight:
+    """Run one task per key; concurrent callers with the same key share its result.
+
+    Successful results are kept for `window` seconds so a retry that arrives
+    just after the original finished gets the same answer instead of redoing
+    the work. Failures are not remembered, so a retry after an error runs again.
+    """
+
+    def __init__(self, name: str, window: float, max_results: int):
+        self.name = name
+        self.window = window
+        self.max_results = max_results
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._completed: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (finished_at, result)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._completed:
+            key, (finished_at, _) = next(iter(self._completed.items()))
+            if now - finished_at <= self.window and len(self._completed) <= self.max_results:
+                break
+            self._completed.popitem(last=False)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._completed[key] = (time.monotonic(), task.result())
+            self._expire()
+
+    async def run(self, key: str, factory):
+        self._expire()
+        if key in self._completed:
+            metrics.incr(f"{self.name}.replayed")
+            return self._completed[key][1]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            metrics.incr(f"{self.name}.started")
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        else:
+            metrics.incr(f"{self.name}.coalesced")
+            logger.info(f"Coalescing duplicate request onto in-flight {self.name} ({key[:16]})")
+        # Shield so one caller disconnecting does not cancel the work others wait on
+        return await asyncio.shield(task)
+
+diagnose_flight = SingleFlight("diagnose_dedup", DIAGNOSE_REPLAY_WINDOW, DIAGNOSE_REPLAY_SIZE)
+
+def diagnose_dedup_key(scope: str, idempotency_key: Optional[str], *content: bytes) -> str:
+    """Client-supplied Idempotency-Key if present, otherwise a hash of the request content"""
+    if idempotency_key:
+        return f"{scope}:key:{idempotency_key.strip()}"
+    digest = hashlib.sha256()
+    for part in content:
+        digest.update(hashlib.sha256(part).digest())
+    return f"{scope}:sha256:{digest.hexdigest()}"
+
+def hash_file(source) -> bytes:
+    """sha256 of a (possibly disk-spooled) upload, read in chunks"""
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.digest()
+
 # ============ AI Helper Functions ============
 
 def get_skill_level_name(level: int) -> str:
@@ -114,20 +1225,81 @@ def get_skill_level_name(level: int) -> str:
     }
     return mapping.get(level, "Beginner")
 
-async def analyze_repair_with_ai(image_base64: str, description: str) -> Dict:
-    """Use Google Gemini 2.5 Flash to analyze the repair need"""
+def build_project(analysis: Dict, image_ref: Optional[str], thumbnail_ref: Optional[str]) -> Project:
+    """Create a Project (with fresh step/material/tool IDs) from a validated analysis"""
+    materials = [
+        MaterialTool(name=m["name"], category="material", estimated_cost=m.get("estimated_cost") or "varies")
+        for m in analysis.get("materials", [])
+    ]
+    tools = [
+        MaterialTool(name=t["name"], category="tool", estimated_cost=t.get("estimated_cost") or "varies")
+        for t in analysis.get("tools", [])
+    ]
+    steps = [
+        InstructionStep(
+            step_number=s["step_number"],
+            title=s["title"],
+            description=s["description"],
+            warning=s.get("warning"),
+            image_hint=s.get("image_hint")
+        )
+        for s in analysis.get("steps", [])
+    ]
+
+    skill_level = analysis.get("skill_level", 2)
+    return Project(
+        title=analysis.get("title", "Repair Project"),
+        description=analysis.get("description", ""),
+        skill_level=skill_level,
+        skill_level_name=get_skill_level_name(skill_level),
+        estimated_time=analysis.get("estimated_time", "1-2 hours"),
+        image_ref=image_ref,
+        thumbnail_ref=thumbnail_ref,
+        hardware_identified=analysis.get("hardware_identified", "Unknown"),
+        issue_type=analysis.get("issue_type", "General repair"),
+        steps=steps,
+        materials=materials,
+        tools=tools,
+        safety_warnings=analysis.get("safety_warnings", []),
+        image_context=analysis.get("visual_context"),
+        image_context_ref=image_ref
+    )
+
+# on_piece(kind, key, value) receives each completed piece of a streamed diagnosis
+DiagnosisPieceCallback = Callable[[str, str, Any], None]
+
+async def analyze_repair_with_ai(
+    image: IngestedImage, description: str, on_piece: Optional[DiagnosisPieceCallback] = None
+) -> Dict:
+    """Use Google Gemini to analyze the repair need from the ingested model image.
+
+    With on_piece the model output is streamed and every completed field and
+    list item is reported as it arrives (replayed at once on a cache hit).
+    """
     try:
-        if "base64," in image_base64:
-            image_base64 = image_base64.split("base64,")[1]
-        
-        try:
-            image_bytes = base64.b64decode(image_base64)
-            image = Image.open(io.BytesIO(image_bytes))
-        except Exception as img_err:
-            logger.error(f"Image processing error: {img_err}")
-            raise HTTPException(status_code=400, detail="Invalid image data")
-            
-        return await analyze_common(image, description)
+        cached = diagnosis_cache.get(image.phash, description)
+        if cached is not None:
+            logger.info("Diagnosis cache hit")
+            if on_piece:
+                for key, value in cached.items():
+                    for item in value if key in STREAMED_ITEM_EVENTS else []:
+                        on_piece("item", key, item)
+                    on_piece("field", key, value)
+            return cached
+
+        image_part = types.Part.from_bytes(data=image.model_image, mime_type=image.model_type)
+        started_at = time.monotonic()
+        if on_piece:
+            analysis = await analyze_streaming(image_part, description, on_piece)
+        else:
+            analysis = await analyze_common(image_part, description)
+        # Compare transformed vs passthrough to see the latency the transform buys
+        mode = "transformed" if MODEL_IMAGE_TRANSFORM else "passthrough"
+        metrics.observe(f"model_media.analysis_seconds.{mode}", time.monotonic() - started_at)
+        diagnosis_cache.put(image.phash, description, analysis)
+        return analysis
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"AI analysis error: {str(e)}")
         # Fallback error handling
@@ -135,58 +1307,18 @@ async def analyze_repair_with_ai(image_base64: str, description: str) -> Dict:
              raise HTTPException(status_code=404, detail=f"AI Model not found or not compatible. {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI analysis failed: {str(e)}")
 
-async def analyze_repair_with_upload(content_part: types.Part, description: str) -> Dict:
-    """Analyze repair using a file part (video or image)"""
+async def analyze_repair_with_upload(content_part, description: str) -> Dict:
+    """Analyze repair using a file part (video or image) or a list of parts (video digest)"""
     return await analyze_common(content_part, description)
 
-async def analyze_common(content, description: str) -> Dict:
-    """Common analysis logic"""
-    try:
-        if not client_genai:
-             raise ValueError("Google GenAI client not initialized. Check API keys.")
-
-        system_context = """You are an expert DIY home repair consultant.
+DIAGNOSIS_SYSTEM_PROMPT = """You are an expert DIY home repair consultant.
 Analyze the provided video or image to give detailed, actionable repair guidance.
 If provided a video, pay attention to sound and movement to diagnose the issue.
 
-Analyze the provided media and description to give detailed, actionable repair guidance."""
-
-        analysis_prompt = f"""{system_context}
-
-User description: {description if description else 'No description provided.'}
-
-Analyze this media for a DIY home repair assessment.
-Provide a comprehensive analysis in the following JSON format:
-{{
-  "title": "Brief descriptive title of the repair (e.g., 'Fix Leaky Moen Kitchen Faucet')",
-  "hardware_identified": "Specific hardware/material identified (brand, model if visible)",
-  "issue_type": "Type of damage or issue identified",
-  "description": "Detailed description of the problem and what needs to be fixed",
-  "skill_level": 1-4 (1=Novice: no power tools, <30min | 2=Beginner: basic tools, 1-2hrs | 3=Intermediate: power tools, potential risks | 4=Expert: permits/specialized knowledge),
-  "estimated_time": "Time estimate (e.g., '30 minutes', '2-3 hours')",
-  "safety_warnings": ["List of important safety warnings"],
-  "steps": [
-    {{
-      "step_number": 1,
-      "title": "Step title",
-      "description": "Detailed step description with micro-steps. Include conditional logic like 'If X, then do Y, otherwise do Z'",
-      "warning": "Optional safety warning for this specific step",
-      "image_hint": "Brief description of what to look for or how to position (for AR overlay)"
-    }}
-  ],
-  "materials": [
-    {{
-      "name": "Material name",
-      "estimated_cost": "$X-Y or 'included' or 'varies'"
-    }}
-  ],
-  "tools": [
-    {{
-      "name": "Tool name",
-      "estimated_cost": "$X-Y or 'common household item'"
-    }}
-  ]
-}}
+Analyze the provided media and description to give detailed, actionable repair guidance.
+
+Analyze this media for a DIY home repair assessment and fill in every field
+of the response schema.
 
 IMPORTANT:
 - Be specific about hardware (brands, models, types)
@@ -194,30 +1326,156 @@ IMPORTANT:
 - Rate difficulty honestly based on the criteria
 - Include at least 5-10 detailed steps
 - List all materials and tools needed
-- Provide safety warnings for any risky steps
-- RETURN ONLY RAW JSON. Do not include markdown formatting like ```json ... ```"""
-
-        response = client_genai.models.generate_content(
-            model='gemini-3-flash-preview', 
-            contents=[analysis_prompt, content],
-            config=types.GenerateContentConfig(
-                temperature=0.2,
+- Provide safety warnings for any risky steps"""
+
+class CachedPrefix:
+    """A static system prompt registered once as Gemini cached content.
+
+    The cache is created lazily, its TTL is extended shortly before expiry, and
+    if caching is unavailable (unsupported model, prompt below the minimum
+    cacheable size, quota) callers get None and send the prompt inline; creation
+    is retried after PROMPT_CACHE_RETRY_AFTER seconds.
+    """
+
+    def __init__(self, model: str, system_instruction: str):
+        self.model = model
+        self.system_instruction = system_instruction
+        self._name: Optional[str] = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return bool(self._name) and time.monotonic() < self._expires_at - PROMPT_CACHE_REFRESH_MARGIN
+
+    async def name(self) -> Optional[str]:
+        if not PROMPT_CACHE_ENABLED or not ai_gateway.available:
+            return None
+        if self._fresh():
+            return self._name
+        if not self._name and time.monotonic() < self._retry_at:
+            return None
+
+        async with self._lock:
+            if self._fresh():
+                return self._name
+            now = time.monotonic()
+            try:
+                if self._name:
+                    await ai_gateway.extend_cache(self._name, PROMPT_CACHE_TTL)
+                    metrics.incr("prompt_cache.refreshed")
+                else:
+                    cache = await ai_gateway.create_cache(self.model, self.system_instruction, PROMPT_CACHE_TTL)
+                    self._name = cache.name
+                    metrics.incr("prompt_cache.created")
+                    logger.info(f"Registered cached prompt {self._name} for {self.model}")
+                self._expires_at = now + PROMPT_CACHE_TTL
+            except Exception as e:
+                if self._name:
+                    # Extending failed (e.g. already expired): recreate on next call
+                    logger.warning(f"Failed to refresh cached prompt {self._name}: {str(e)}")
+                    self.invalidate()
+                    return None
+                logger.warning(f"Prompt caching unavailable, sending prompt inline: {str(e)}")
+                metrics.incr("prompt_cache.unavailable")
+                self._retry_at = now + PROMPT_CACHE_RETRY_AFTER
+            return self._name
+
+    def invalidate(self) -> None:
+        self._name = None
+        self._expires_at = 0.0
+
+diagnosis_prompt_cache = CachedPrefix(DIAGNOSIS_MODEL, DIAGNOSIS_SYSTEM_PROMPT)
+
+def diagnosis_config(cached_content: Optional[str] = None) -> types.GenerateContentConfig:
+    """Generation config for diagnoses, referencing the cached prompt when available"""
+    prompt = {"cached_content": cached_content} if cached_content else {"system_instruction": DIAGNOSIS_SYSTEM_PROMPT}
+    return types.GenerateContentConfig(
+        temperature=0.2,
+        response_mime_type="application/json",
+        response_schema=DiagnosisAnalysis,
+        **prompt
+    )
+
+async def generate_diagnosis(contents: List):
+    """Run the diagnosis prompt, falling back to the inline prompt if the cache is gone"""
+    cached_content = await diagnosis_prompt_cache.name()
+    if cached_content:
+        try:
+            response = await ai_gateway.generate_content(
+                model=DIAGNOSIS_MODEL, contents=contents, config=diagnosis_config(cached_content)
             )
+            metrics.incr("prompt_cache.hits")
+            return response
+        except Exception as e:
+            logger.warning(f"Cached prompt request failed, retrying inline: {str(e)}")
+            diagnosis_prompt_cache.invalidate()
+    metrics.incr("prompt_cache.misses")
+    return await ai_gateway.generate_content(model=DIAGNOSIS_MODEL, contents=contents, config=diagnosis_config())
+
+def finalize_diagnosis(analysis: DiagnosisAnalysis) -> Dict:
+    analysis.skill_level = min(max(analysis.skill_level, 1), 4)
+    return analysis.dict()
+
+def parse_diagnosis(text: str) -> Dict:
+    """Validate a diagnosis reply against DiagnosisAnalysis, tolerating code fences"""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return finalize_diagnosis(DiagnosisAnalysis(**json.loads(text)))
+
+async def repair_diagnosis(bad_output: str, error: Exception) -> Dict:
+    """Ask the model to fix an invalid reply (text only, no media re-upload)"""
+    for attempt in range(1, DIAGNOSIS_REPAIR_ATTEMPTS + 1):
+        metrics.incr("diagnosis.repair_attempts")
+        repair_prompt = f"""The following DIY repair diagnosis was supposed to be JSON matching the response schema, but it is invalid.
+Error: {str(error)[:500]}
+
+Return the corrected JSON only, keeping the original content wherever possible.
+
+Invalid output:
+{bad_output[:30000]}"""
+        response = await generate_diagnosis([repair_prompt])
+        try:
+            analysis = parse_diagnosis(response.text)
+            metrics.incr("diagnosis.repairs_succeeded")
+            logger.info(f"Diagnosis output repaired on attempt {attempt}")
+            return analysis
+        except Exception as e:
+            bad_output, error = response.text or "", e
+            metrics.incr("diagnosis.parse_failures")
+            logger.warning(f"Diagnosis repair attempt {attempt} still invalid: {str(e)}")
+
+    metrics.incr("diagnosis.repairs_failed")
+    raise HTTPException(status_code=502, detail="AI returned an invalid diagnosis. Please try again.")
+
+async def analyze_common(content, description: str) -> Dict:
+    """Common analysis logic"""
+    try:
+        if not ai_gateway.available:
+             raise ValueError("Google GenAI client not initialized. Check API keys.")
+
+        # The static instructions live in DIAGNOSIS_SYSTEM_PROMPT (cached when possible)
+        analysis_prompt = f"User description: {description if description else 'No description provided.'}"
+
+        response = await generate_diagnosis(
+            [analysis_prompt, *content] if isinstance(content, list) else [analysis_prompt, content]
         )
-        
-        response_text = response.text
         logger.info(f"AI Response received")
 
-        # Clean up response if it contains markdown
-        response_text = response_text.strip()
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        analysis = json.loads(response_text)
-        return analysis
+        # Structured output: the SDK parses against the schema when it can
+        if isinstance(response.parsed, DiagnosisAnalysis):
+            return finalize_diagnosis(response.parsed)
+        try:
+            return parse_diagnosis(response.text)
+        except Exception as parse_err:
+            metrics.incr("diagnosis.parse_failures")
+            logger.warning(f"Invalid diagnosis output, attempting repair: {str(parse_err)}")
+            return await repair_diagnosis(response.text or "", parse_err)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"AI analysis error: {str(e)}")
         # Fallback error handling
@@ -226,6 +1484,477 @@ IMPORTANT:
         raise HTTPException(status_code=500, detail=f"AI analysis failed: {str(e)}")
 
 
+# ============ Streaming Diagnosis ============
+
+class PartialJSONScanner:
+    """Scan a JSON object as it streams in and report the pieces that are complete.
+
+    feed() returns ("field", key, value) once a top-level field's value is
+    complete, and ("item", key, value) for each complete element of a top-level
+    array (e.g. every step), so they can be forwarded before the whole object
+    has arrived.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.state = "key"  # at depth 1: key -> colon -> value_start -> value
+        self.key: Optional[str] = None
+        self.key_start: Optional[int] = None
+        self.value_start: Optional[int] = None
+        self.array_key: Optional[str] = None  # top-level key whose array we are inside
+        self.item_start: Optional[int] = None
+
+    def _parse(self, start: int, end: int):
+        return json.loads(self.buffer[start:end])
+
+    def _end_field(self, events: List) -> None:
+        if self.state == "value" and self.value_start is not None:
+            try:
+                events.append(("field", self.key, self._parse(self.value_start, self.pos)))
+            except ValueError:
+                pass
+        self.state, self.value_start = "key", None
+
+    def _end_item(self, events: List) -> None:
+        if self.item_start is not None:
+            try:
+                events.append(("item", self.array_key, self._parse(self.item_start, self.pos)))
+            except ValueError:
+                pass
+        self.item_start = None
+
+    def feed(self, chunk: str) -> List[tuple]:
+        events = []
+        self.buffer += chunk
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.state == "key" and self.key_start is not None:
+                        self.key = self._parse(self.key_start, self.pos + 1)
+                        self.state = "colon"
+                self.pos += 1
+                continue
+
+            if not ch.isspace():
+                if self.depth == 1 and self.state == "value_start":
+                    self.value_start, self.state = self.pos, "value"
+                if self.depth == 2 and self.array_key is not None and self.item_start is None and ch not in ",]":
+                    self.item_start = self.pos
+
+                if ch == '"':
+                    self.in_string = True
+                    if self.depth == 1 and self.state == "key":
+                        self.key_start = self.pos
+                elif ch in "{[":
+                    if self.depth == 1 and ch == "[":
+                        self.array_key = self.key
+                    self.depth += 1
+                elif ch in "}]":
+                    if self.depth == 2 and self.array_key is not None:
+                        self._end_item(events)
+                        self.array_key = None
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self._end_field(events)
+                elif ch == ",":
+                    if self.depth == 1:
+                        self._end_field(events)
+                    elif self.depth == 2 and self.array_key is not None:
+                        self._end_item(events)
+                elif ch == ":" and self.depth == 1 and self.state == "colon":
+                    self.state = "value_start"
+            self.pos += 1
+        return events
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Top-level array fields are streamed item by item under these event names
+STREAMED_ITEM_EVENTS = {"steps": "step", "materials": "material", "tools": "tool"}
+
+def diagnosis_events(kind: str, key: str, value) -> List[str]:
+    """SSE events for one completed piece of the streamed diagnosis"""
+    if kind == "item":
+        event = STREAMED_ITEM_EVENTS.get(key)
+        return [sse_event(event, value)] if event else []
+    if key in STREAMED_ITEM_EVENTS:
+        return []  # Already sent item by item
+    if key == "visual_context":
+        return []  # Stored for step images, not shown
+    if key == "skill_level" and isinstance(value, int):
+        return [sse_event("skill_level", {"skill_level": value, "skill_level_name": get_skill_level_name(value)})]
+    return [sse_event(key, value)]
+
+async def stream_diagnosis(contents: List):
+    """Yield response text chunks, using the cached prompt when available"""
+    cached_content = await diagnosis_prompt_cache.name()
+    if cached_content:
+        started = False
+        try:
+            async for chunk in ai_gateway.generate_content_stream(
+                model=DIAGNOSIS_MODEL, contents=contents, config=diagnosis_config(cached_content)
+            ):
+                started = True
+                if chunk.text:
+                    yield chunk.text
+            metrics.incr("prompt_cache.hits")
+            return
+        except Exception as e:
+            if started:
+                raise
+            logger.warning(f"Cached prompt stream failed, retrying inline: {str(e)}")
+            diagnosis_prompt_cache.invalidate()
+    metrics.incr("prompt_cache.misses")
+    async for chunk in ai_gateway.generate_content_stream(
+        model=DIAGNOSIS_MODEL, contents=contents, config=diagnosis_config()
+    ):
+        if chunk.text:
+            yield chunk.text
+
+async def analyze_streaming(content, description: str, on_piece: DiagnosisPieceCallback) -> Dict:
+    """Like analyze_common, but streams the reply and reports pieces as they complete"""
+    if not ai_gateway.available:
+        raise ValueError("Google GenAI client not initialized. Check API keys.")
+    scanner = PartialJSONScanner()
+    contents = [f"User description: {description if description else 'No description provided.'}", content]
+    async for text in stream_diagnosis(contents):
+        for piece in scanner.feed(text):
+            on_piece(*piece)
+    try:
+        return parse_diagnosis(scanner.buffer)
+    except Exception as parse_err:
+        metrics.incr("diagnosis.parse_failures")
+        return await repair_diagnosis(scanner.buffer, parse_err)
+
+# ============ Upload Handling ============
+
+class UploadSizeLimitMiddleware:
+    """Reject request bodies larger than max_bytes with 413 as they stream in.
+
+    Content-Length is checked up front; chunked bodies are counted as they are
+    received, so an oversized upload is cut off without being buffered.
+    """
+
+    def __init__(self, app, max_bytes: int, paths: set):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise ValueError("Upload exceeds size limit")
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                # Swallow whatever error response the app produced; we send 413 below
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        metrics.incr("uploads.rejected_too_large")
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit"}
+        )
+        await response(scope, receive, send)
+
+def upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    position = file.file.tell()
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(position)
+    return size
+
+def spool_to_named_file(source, suffix: str) -> str:
+    """Copy an upload to a named temp file (the Files API needs a path)"""
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+        return target.name
+
+# ============ Response Compression ============
+
+# Already compressed, or streamed event by event (compression would buffer events)
+UNCOMPRESSED_CONTENT_TYPES = ("image/", "video/", "audio/", "text/event-stream", "application/zip", "application/gzip")
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """Compress complete response bodies with brotli or gzip, per Accept-Encoding.
+
+    Only single-message bodies of at least min_size bytes are compressed;
+    streaming responses, images/video and responses that already carry a
+    Content-Encoding pass through untouched. Compressed responses get
+    Vary: Accept-Encoding and a weak ETag (the bytes differ from the identity
+    representation, the content does not).
+    """
+
+    def __init__(self, app, encodings: List[str], min_size: int):
+        self.app = app
+        self.encodings = [e for e in encodings if e == "gzip" or (e == "br" and brotli is not None)]
+        self.min_size = min_size
+
+    @staticmethod
+    def _quality(params: List[str]) -> float:
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    return float(value)
+                except ValueError:
+                    return 0.0  # Malformed weight: treat as not acceptable
+        return 1.0
+
+    def _negotiate(self, scope) -> Optional[str]:
+        accept = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1").lower()
+        accepted = set()
+        for part in accept.split(","):
+            coding, *params = part.split(";")
+            if coding.strip() and self._quality(params) > 0:
+                accepted.add(coding.strip())
+        return next((e for e in self.encodings if e in accepted), None)
+
+    async def __call__(self, scope, receive, send):
+        encoding = self._negotiate(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+                if b"content-encoding" in headers or content_type.startswith(UNCOMPRESSED_CONTENT_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.min_size:
+                # Streaming or small: send as-is
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) > COMPRESSION_THREAD_THRESHOLD:
+                compressed = await asyncio.to_thread(compress_body, body, encoding)
+            else:
+                compressed = compress_body(body, encoding)
+            if len(compressed) >= len(body):
+                await send(start_message)
+                await send(message)
+                return
+
+            metrics.incr(f"compression.{encoding}_responses")
+            metrics.incr("compression.bytes_in", len(body))
+            metrics.incr("compression.bytes_out", len(compressed))
+            metrics.observe("compression.ratio", len(compressed) / len(body))
+
+            headers = []
+            vary = b"Accept-Encoding"
+            for key, value in start_message.get("headers", []):
+                name = key.lower()
+                if name == b"content-length":
+                    continue
+                if name == b"vary":
+                    vary = value + b", " + vary
+                    continue
+                if name == b"etag" and not value.startswith(b"W/"):
+                    value = b"W/" + value
+                headers.append((key, value))
+            headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+                (b"vary", vary),
+            ]
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, compressing_send)
+
+# ============ Video Preprocessing ============
+
+class VideoDigest(NamedTuple):
+    frames: List[bytes]  # JPEG keyframes in chronological order
+    audio: Optional[bytes]  # Mono AAC (ADTS), None if the video has no audio track
+    interval: float  # Seconds between keyframes
+    duration: Optional[float]  # Length of the video, None if it could not be probed
+
+async def run_ffmpeg(*args: str) -> bool:
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=VIDEO_PREPROCESS_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        logger.warning("ffmpeg timed out")
+        return False
+    if process.returncode != 0:
+        logger.info(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='replace')[-300:]}")
+        return False
+    return True
+
+async def probe_duration(path: str) -> Optional[float]:
+    """Video length in seconds via ffprobe, None if unavailable"""
+    if not shutil.which("ffprobe"):
+        return None
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout=VIDEO_PREPROCESS_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return None
+    try:
+        duration = float(stdout.decode().strip())
+    except ValueError:
+        return None
+    return duration if duration > 0 else None
+
+def keyframe_interval(duration: Optional[float]) -> float:
+    """Seconds between keyframes: VIDEO_KEYFRAME_FPS for short clips, sparser for long
+    ones so that VIDEO_MAX_KEYFRAMES frames still span the whole video"""
+    interval = 1 / VIDEO_KEYFRAME_FPS
+    if duration:
+        interval = max(interval, duration / VIDEO_MAX_KEYFRAMES)
+    return interval
+
+async def preprocess_video(path: str) -> Optional[VideoDigest]:
+    """Sample keyframes and a downsampled audio track from a video on disk.
+
+    Returns None when ffmpeg is unavailable or no frames could be extracted, in
+    which case the caller sends the original video instead.
+    """
+    if not shutil.which("ffmpeg"):
+        metrics.incr("video.preprocess_unavailable")
+        return None
+
+    started_at = time.monotonic()
+    duration = await probe_duration(path)
+    interval = keyframe_interval(duration)
+    with tempfile.TemporaryDirectory() as work_dir:
+        edge = VIDEO_KEYFRAME_MAX_EDGE
+        scale = f"scale='if(gt(iw,ih),min({edge},iw),-2)':'if(gt(iw,ih),-2,min({edge},ih))'"
+        frames_ok, audio_ok = await asyncio.gather(
+            run_ffmpeg(
+                "-i", path, "-vf", f"fps=1/{interval:.6f},{scale}",
+                "-frames:v", str(VIDEO_MAX_KEYFRAMES), "-q:v", "4",
+                os.path.join(work_dir, "frame_%03d.jpg"),
+            ),
+            run_ffmpeg(
+                "-i", path, "-vn", "-ac", "1", "-ar", str(VIDEO_AUDIO_SAMPLE_RATE),
+                "-c:a", "aac", "-b:a", VIDEO_AUDIO_BITRATE, "-f", "adts",
+                os.path.join(work_dir, "audio.aac"),
+            ),
+        )
+
+        frame_paths = sorted(Path(work_dir).glob("frame_*.jpg")) if frames_ok else []
+        if not frame_paths:
+            metrics.incr("video.preprocess_failed")
+            return None
+        frames = [await asyncio.to_thread(frame.read_bytes) for frame in frame_paths]
+        audio_path = Path(work_dir) / "audio.aac"
+        audio = await asyncio.to_thread(audio_path.read_bytes) if audio_ok and audio_path.exists() else None
+
+    digest = VideoDigest(frames, audio or None, interval, duration)
+    digest_bytes = sum(len(f) for f in frames) + len(audio or b"")
+    elapsed = time.monotonic() - started_at
+    metrics.incr("video.preprocessed")
+    metrics.incr("video.bytes_in", os.path.getsize(path))
+    metrics.incr("video.bytes_out", digest_bytes)
+    metrics.observe("video.preprocess_seconds", elapsed)
+    logger.info(
+        f"Video preprocessed: {os.path.getsize(path)} -> {digest_bytes} bytes "
+        f"({len(frames)} frames, audio={'yes' if audio else 'no'}, {elapsed * 1000:.0f} ms)"
+    )
+    return digest
+
+def format_seconds(seconds: float) -> str:
+    return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+def video_digest_parts(digest: VideoDigest) -> List:
+    """Model contents describing a video as sampled keyframes plus its audio"""
+    covered = len(digest.frames) * digest.interval
+    if digest.duration:
+        span = (
+            f"covering 0:00-{format_seconds(min(covered, digest.duration))} "
+            f"of a {format_seconds(digest.duration)} video"
+        )
+    else:
+        span = f"covering about the first {format_seconds(covered)} (the video may be longer)"
+    parts = [
+        f"The user's video was sampled into {len(digest.frames)} keyframes, one every "
+        f"{digest.interval:.3g} seconds, {span}, in chronological order"
+        + (", followed by the audio track of the whole video." if digest.audio else ". The video has no audio track.")
+    ]
+    parts.extend(types.Part.from_bytes(data=frame, mime_type="image/jpeg") for frame in digest.frames)
+    if digest.audio:
+        parts.append(types.Part.from_bytes(data=digest.audio, mime_type="audio/aac"))
+    return parts
+
 # ============ API Routes ============
 
 @app.get("/")
@@ -236,86 +1965,65 @@ async def health_check():
 async def root():
     return {"message": "DIY Home Repair API", "status": "running"}
 
+@api_router.get("/metrics")
+async def get_metrics():
+    """In-process metrics: AI gateway queue depth, latencies and counters"""
+    return {"ai_gateway": ai_gateway.stats(), "step_image_cache": step_image_cache.stats(), **metrics.snapshot()}
+
 @api_router.post("/diagnose", response_model=ProjectResponse)
-async def diagnose_repair(request: DiagnosisRequest):
-    """Analyze an image and create a repair project"""
-    try:
-        # Validate base64 image
-        if not request.image_base64:
-            raise HTTPException(status_code=400, detail="Image is required")
+async def diagnose_repair(request: DiagnosisRequest, idempotency_key: Optional[str] = Header(default=None)):
+    """Analyze an image and create a repair project.
 
-        # Get AI analysis
-        analysis = await analyze_repair_with_ai(request.image_base64, request.description or "")
+    Retries of the same request (same Idempotency-Key, or same image and
+    description) share one analysis and get the same project back.
+    """
+    key = diagnose_dedup_key(
+        "diagnose", idempotency_key,
+        request.image_base64.encode("utf-8"), normalize_description(request.description or "").encode("utf-8")
+    )
+    return await diagnose_flight.run(key, lambda: create_project_from_image(request))
 
-        # Create materials and tools lists with IDs
-        materials = [
-            MaterialTool(
-                name=m["name"],
-                category="material",
-                estimated_cost=m.get("estimated_cost", "varies")
-            )
-            for m in analysis.get("materials", [])
-        ]
+async def save_project(analysis: Dict, preview: Optional[IngestedImage] = None, client_thumbnail: str = "") -> Project:
+    """Store the preview image and thumbnail, insert the project and queue its image prefetch.
 
-        tools = [
-            MaterialTool(
-                name=t["name"],
-                category="tool",
-                estimated_cost=t.get("estimated_cost", "varies")
-            )
-            for t in analysis.get("tools", [])
-        ]
+    client_thumbnail (a data URL) is used only when there is no server-built preview.
+    """
+    image_ref = thumbnail_ref = None
+    if preview:
+        image_ref, thumbnail_ref = await asyncio.gather(
+            blob_store.put(preview.original, preview.original_type),
+            blob_store.put(preview.thumbnail, "image/jpeg"),
+        )
+    elif client_thumbnail:
+        thumbnail = decode_data_url(client_thumbnail)
+        image_ref = thumbnail_ref = await blob_store.put(thumbnail.data, thumbnail.content_type)
 
-        # Create instruction steps with IDs
-        steps = [
-            InstructionStep(
-                step_number=s["step_number"],
-                title=s["title"],
-                description=s["description"],
-                warning=s.get("warning"),
-                image_hint=s.get("image_hint")
-            )
-            for s in analysis.get("steps", [])
-        ]
+    project = build_project(analysis, image_ref, thumbnail_ref)
+    await db.projects.insert_one(project.dict())
+    await bump_projects_version()
+    await image_jobs.prefetch(project)
+    logger.info(f"Project created: {project.id}")
+    return project
 
-        # Create thumbnail from image
-        try:
-            img_data = request.image_base64.split("base64,")[1] if "base64," in request.image_base64 else request.image_base64
-            img_bytes = base64.b64decode(img_data)
-            img = Image.open(io.BytesIO(img_bytes))
-            img.thumbnail((300, 300)) # Resize to max 300x300
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG", quality=70)
-            thumb_base64_data = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            real_thumbnail = f"data:image/jpeg;base64,{thumb_base64_data}"
-        except Exception as e:
-            logger.warning(f"Failed to generate thumbnail: {e}")
-            real_thumbnail = request.image_base64 # Fallback
-
-        # Create project
-        skill_level = analysis.get("skill_level", 2)
-        project = Project(
-            title=analysis.get("title", "Repair Project"),
-            description=analysis.get("description", ""),
-            skill_level=skill_level,
-            skill_level_name=get_skill_level_name(skill_level),
-            estimated_time=analysis.get("estimated_time", "1-2 hours"),
-            image_base64=request.image_base64,
-            thumbnail_base64=real_thumbnail, 
-            hardware_identified=analysis.get("hardware_identified", "Unknown"),
-            issue_type=analysis.get("issue_type", "General repair"),
-            steps=steps,
-            materials=materials,
-            tools=tools,
-            safety_warnings=analysis.get("safety_warnings", [])
-        )
+async def diagnose_to_project(
+    ingested: IngestedImage, description: str, on_piece: Optional[DiagnosisPieceCallback] = None
+) -> Project:
+    """Analyze an ingested image (through the diagnosis cache) and persist the project"""
+    analysis = await analyze_repair_with_ai(ingested, description, on_piece)
+    return await save_project(analysis, ingested)
 
-        # Save to database
-        project_dict = project.dict()
-        await db.projects.insert_one(project_dict)
+async def create_project_from_image(request: DiagnosisRequest) -> ProjectResponse:
+    """Analyze a base64 image and persist the project"""
+    try:
+        # Validate base64 image
+        if not request.image_base64:
+            raise HTTPException(status_code=400, detail="Image is required")
 
-        logger.info(f"Project created: {project.id}")
-        return ProjectResponse(project=project)
+        # Decode once; everything else is derived from this single decode
+        ingested = await ingest_or_400(request.image_base64)
+
+        project = await diagnose_to_project(ingested, request.description or "")
+        return ProjectResponse(project=Project(**attach_image_urls(project.dict())))
 
     except HTTPException:
         raise
@@ -323,169 +2031,295 @@ async def diagnose_repair(request: DiagnosisRequest):
         logger.error(f"Diagnosis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to diagnose: {str(e)}")
 
+@api_router.post("/diagnose/stream")
+async def diagnose_repair_stream(request: DiagnosisRequest):
+    """Analyze an image and stream the diagnosis as Server-Sent Events.
+
+    Events are sent as soon as each piece can be parsed from the partial model
+    output: title, skill_level, safety_warnings and the other top-level fields,
+    then one `step` / `material` / `tool` event per item. The final `project`
+    event carries the persisted project; failures end the stream with `error`.
+    """
+    if not request.image_base64:
+        raise HTTPException(status_code=400, detail="Image is required")
+    ingested = await ingest_or_400(request.image_base64)
+    description = request.description or ""
+
+    async def events():
+        started_at = time.monotonic()
+        first_event_at = None
+        pieces: asyncio.Queue = asyncio.Queue()
+
+        async def diagnose() -> Project:
+            try:
+                return await diagnose_to_project(ingested, description, lambda *piece: pieces.put_nowait(piece))
+            finally:
+                pieces.put_nowait(None)  # End of pieces
+
+        task = asyncio.create_task(diagnose())
+        try:
+            yield sse_event("status", {"stage": "analyzing"})
+            while (piece := await pieces.get()) is not None:
+                for event in diagnosis_events(*piece):
+                    if first_event_at is None:
+                        first_event_at = time.monotonic()
+                        metrics.observe("diagnosis_stream.first_event_seconds", first_event_at - started_at)
+                    yield event
+
+            project = await task
+            metrics.observe("diagnosis_stream.total_seconds", time.monotonic() - started_at)
+            yield sse_event("project", {
+                "project_id": project.id,
+                "project": json.loads(Project(**attach_image_urls(project.dict())).json()),
+            })
+        except HTTPException as e:
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Streaming diagnosis error: {str(e)}")
+            metrics.incr("diagnosis_stream.errors")
+            yield sse_event("error", {"status": 500, "detail": f"Failed to diagnose: {str(e)}"})
+        finally:
+            task.cancel()  # Client went away mid-diagnosis
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @api_router.post("/diagnose-upload", response_model=ProjectResponse)
 async def diagnose_upload(
     file: UploadFile = File(...),
     description: str = Form(default=""),
-    thumbnail_base64: str = Form(default="")
+    thumbnail_base64: str = Form(default=""),
+    idempotency_key: Optional[str] = Header(default=None)
 ):
     """Analyze an uploaded file (video/image) and create a repair project.
+
+    Retries of the same upload (same Idempotency-Key, or same file bytes and
+    description) share one analysis and get the same project back.
+    """
+    content_hash = b"" if idempotency_key else await asyncio.to_thread(hash_file, file.file)
+    key = diagnose_dedup_key(
+        "diagnose-upload", idempotency_key, content_hash, normalize_description(description).encode("utf-8")
+    )
+    return await diagnose_flight.run(key, lambda: create_project_from_upload(file, description, thumbnail_base64))
+
+async def create_project_from_upload(file: UploadFile, description: str, thumbnail_base64: str) -> ProjectResponse:
+    """Analyze an uploaded file and persist the project.
     
-    This endpoint processes videos and images in-memory without saving to disk,
-    making it compatible with stateless deployments like Render.com.
+    The upload is spooled to a temporary file past UPLOAD_SPOOL_THRESHOLD and
+    never fully read into memory unless it is small enough to inline; large
+    videos are handed to Gemini through the Files API. Only temporary files
+    are used, so this stays compatible with stateless hosts like Render.com.
     """
+    uploaded_file = None
     try:
         logger.info(f"Received upload: filename={file.filename}, content_type={file.content_type}, description_length={len(description)}, thumbnail_provided={bool(thumbnail_base64)}")
         
-        # Read file content
-        content_bytes = await file.read()
+        size = upload_size(file)
         mime_type = file.content_type or "application/octet-stream"
+        if size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {UPLOAD_MAX_BYTES // (1024 * 1024)} MB limit")
         
-        logger.info(f"File read: {len(content_bytes)} bytes, mime_type={mime_type}")
+        logger.info(f"File received: {size} bytes, mime_type={mime_type}")
+        metrics.observe("uploads.bytes", size)
         
         # Determine if video or image
         is_video = mime_type.startswith("video")
         
-        # Create GenAI part for AI analysis
-        content_part = types.Part.from_bytes(data=content_bytes, mime_type=mime_type)
+        # Images go through the same ingest/pre-model transform as /api/diagnose
+        ingested = None
+        preview = None  # Server-built image/thumbnail for the project
+        content_part = None
+        if not is_video:
+            if size > UPLOAD_IMAGE_MAX_BYTES:
+                raise HTTPException(
+                    status_code=413, detail=f"Images are limited to {UPLOAD_IMAGE_MAX_BYTES // (1024 * 1024)} MB"
+                )
+            ingested = preview = await ingest_or_400(await file.read(), mime_type)
+        else:
+            suffix = Path(file.filename or "").suffix
+            temp_path = await asyncio.to_thread(spool_to_named_file, file.file, suffix)
+            try:
+                # Prefer a compact keyframes + audio digest over the full-bitrate video
+                digest = await preprocess_video(temp_path) if VIDEO_PREPROCESS else None
+                if digest:
+                    content_part = video_digest_parts(digest)
+                    preview = await run_image_job(ingest_image, digest.frames[0], "image/jpeg")
+                elif size <= UPLOAD_INLINE_MAX_BYTES:
+                    video_bytes = await asyncio.to_thread(Path(temp_path).read_bytes)
+                    content_part = types.Part.from_bytes(data=video_bytes, mime_type=mime_type)
+                else:
+                    # Too large to inline: upload through the Files API
+                    metrics.incr("uploads.files_api")
+                    uploaded_file = await ai_gateway.upload_file(temp_path, mime_type)
+                    content_part = types.Part.from_uri(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type or mime_type)
+            finally:
+                os.unlink(temp_path)
         
         # Analyze with AI
         logger.info("Starting AI analysis...")
-        analysis = await analyze_repair_with_upload(content_part, description)
-        logger.info(f"AI analysis complete: {analysis.get('title', 'No title')}")
-        
-        # Helper function to normalize base64 data (ensure single prefix)
-        def normalize_base64(data: str) -> str:
-            if not data:
-                return ""
-            # Strip existing prefix if present
-            if "base64," in data:
-                data = data.split("base64,")[1]
-            # Add proper prefix
-            return f"data:image/jpeg;base64,{data}"
-        
-        # Handle image/thumbnail storage
-        stored_image_base64 = ""
-        stored_thumbnail_base64 = ""
-        
-        if is_video:
-            # For videos, use the provided thumbnail
-            stored_image_base64 = normalize_base64(thumbnail_base64)
-            stored_thumbnail_base64 = stored_image_base64
+        if ingested:
+            analysis = await analyze_repair_with_ai(ingested, description)
         else:
-            # For images, use thumbnail if provided, otherwise encode the uploaded image
-            if thumbnail_base64:
-                stored_image_base64 = normalize_base64(thumbnail_base64)
-            else:
-                img_b64 = base64.b64encode(content_bytes).decode('utf-8')
-                stored_image_base64 = f"data:image/jpeg;base64,{img_b64}"
-            stored_thumbnail_base64 = stored_image_base64
-
-        # Create materials/tools/steps
-        materials = [
-            MaterialTool(name=m["name"], category="material", estimated_cost=m.get("estimated_cost", "varies"))
-            for m in analysis.get("materials", [])
-        ]
-        tools = [
-            MaterialTool(name=t["name"], category="tool", estimated_cost=t.get("estimated_cost", "varies"))
-            for t in analysis.get("tools", [])
-        ]
-        steps = [
-            InstructionStep(
-                step_number=s["step_number"],
-                title=s["title"],
-                description=s["description"],
-                warning=s.get("warning"),
-                image_hint=s.get("image_hint")
-            )
-            for s in analysis.get("steps", [])
-        ]
-
-        skill_level = analysis.get("skill_level", 2)
-        project = Project(
-            title=analysis.get("title", "Repair Project"),
-            description=analysis.get("description", ""),
-            skill_level=skill_level,
-            skill_level_name=get_skill_level_name(skill_level),
-            estimated_time=analysis.get("estimated_time", "1-2 hours"),
-            image_base64=stored_image_base64,
-            thumbnail_base64=stored_thumbnail_base64,
-            hardware_identified=analysis.get("hardware_identified", "Unknown"),
-            issue_type=analysis.get("issue_type", "General repair"),
-            steps=steps,
-            materials=materials,
-            tools=tools,
-            safety_warnings=analysis.get("safety_warnings", [])
-        )
+            analysis = await analyze_repair_with_upload(content_part, description)
+        logger.info(f"AI analysis complete: {analysis.get('title', 'No title')}")
         
-        await db.projects.insert_one(project.dict())
-        logger.info(f"Project created via upload: {project.id}")
-        return ProjectResponse(project=project)
+        # Client-provided thumbnail only when the server could not build a preview
+        project = await save_project(analysis, preview, thumbnail_base64)
+        return ProjectResponse(project=Project(**attach_image_urls(project.dict())))
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Diagnosis upload error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to diagnose: {str(e)}")
+    finally:
+        if uploaded_file is not None:
+            await ai_gateway.delete_file(uploaded_file.name)
 
 @api_router.get("/projects", response_model=ProjectListResponse)
-async def get_projects():
-    """Get all saved projects"""
+async def get_projects(
+    limit: int = Query(default=PROJECTS_PAGE_SIZE, ge=1, le=100),
+    before: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """List saved projects, newest first, one page at a time.
+
+    Only card fields are read from MongoDB, and paging walks the
+    (created_at, id) index from the ?before= cursor instead of skipping.
+    Pages carry an ETag derived from the collection version: revalidating an
+    unchanged page costs one tiny read and returns 304.
+    """
     try:
-        # Optimize: exclude large base64 images from list view
-        # Include thumbnail_base64
-        projection = {
-            "image_base64": 0  # Exclude base64 to reduce payload
-        }
-        projects_data = await db.projects.find({}, projection).sort("created_at", -1).to_list(100)
+        # Read the version before the page so a concurrent write can only make the ETag stale
+        headers = versioned_headers(version_etag("projects", await projects_version(), limit, before or ""))
+        if etag_matches(if_none_match, headers["ETag"]):
+            metrics.incr("projects.list_not_modified")
+            return Response(status_code=304, headers=headers)
+
+        query = decode_project_cursor(before) if before else {}
+        # Fetch one extra row to know whether another page exists
+        projects_data = await db.projects.find(query, PROJECT_SUMMARY_PROJECTION) \
+            .sort([("created_at", -1), ("id", -1)]) \
+            .limit(limit + 1) \
+            .to_list(limit + 1)
         
-        # Add placeholder for image_base64 to satisfy model
+        has_more = len(projects_data) > limit
+        projects_data = projects_data[:limit]
         for proj in projects_data:
-            proj["image_base64"] = ""
-            if "thumbnail_base64" not in proj:
-                 proj["thumbnail_base64"] = ""
+            proj["thumbnail_url"] = image_url(proj.get("thumbnail_ref"))
         
-        projects = [Project(**proj) for proj in projects_data]
-        return ProjectListResponse(projects=projects)
+        projects = [trusted_payload(ProjectSummary, proj) for proj in projects_data]
+        next_cursor = None
+        if has_more and projects:
+            next_cursor = encode_project_cursor(projects[-1]["created_at"], projects[-1]["id"])
+        return FastJSONResponse({"projects": projects, "next_cursor": next_cursor}, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to fetch projects: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch projects: {str(e)}")
 
 @api_router.get("/projects/{project_id}", response_model=ProjectResponse)
-async def get_project(project_id: str):
-    """Get a specific project by ID"""
+async def get_project(project_id: str, if_none_match: Optional[str] = Header(default=None)):
+    """Get a specific project by ID, with image URLs and availability flags instead of pixels.
+
+    The ETag follows the project's version, so a revalidation of an unchanged
+    project reads only that number and returns 304.
+    """
     try:
-        project_data = await db.projects.find_one({"id": project_id})
+        if if_none_match:
+            current = await db.projects.find_one({"id": project_id}, {"_id": 0, "version": 1})
+            if not current:
+                raise HTTPException(status_code=404, detail="Project not found")
+            headers = versioned_headers(version_etag("project", project_id, current.get("version", 0)))
+            if etag_matches(if_none_match, headers["ETag"]):
+                metrics.incr("projects.detail_not_modified")
+                return Response(status_code=304, headers=headers)
+
+        project_data = await db.projects.find_one({"id": project_id}, PROJECT_DETAIL_PROJECTION)
         if not project_data:
             raise HTTPException(status_code=404, detail="Project not found")
-        project = Project(**project_data)
-        return ProjectResponse(project=project)
+        # Legacy projects have no image_ref: move their inline images out once, then re-read.
+        # Projects without media (e.g. videos with no thumbnail) are only checked once too
+        if not project_data.get("image_ref") and not project_data.get("inline_images_checked"):
+            try:
+                if await migrate_inline_images(project_id):
+                    project_data = await db.projects.find_one({"id": project_id}, PROJECT_DETAIL_PROJECTION)
+            except Exception as migrate_err:
+                logger.error(f"Inline image migration failed for {project_id}: {str(migrate_err)}")
+        project_data["version"] = project_data.get("version", 0)
+        headers = versioned_headers(version_etag("project", project_id, project_data["version"]))
+        return FastJSONResponse({"project": project_payload(project_data)}, headers=headers)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Failed to fetch project: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch project: {str(e)}")
 
+async def apply_item_changes(project_id: str, changes: List[ToggleItemRequest]) -> List[ItemOutcome]:
+    """Set already_owned for any mix of materials and tools in one atomic update.
+
+    Items are matched in both arrays through two array filters (one per target
+    value); the updated document's item ids give the per-item outcome. The
+    project is only written (and its version bumped) if it has one of the items.
+    """
+    wanted = {change.item_id: change.owned for change in changes}  # Last change per item wins
+    update: Dict[str, bool] = {}
+    array_filters = []
+    for name, owned in (("own", True), ("disown", False)):
+        ids = [item_id for item_id, value in wanted.items() if value == owned]
+        if ids:
+            update[f"materials.$[{name}].already_owned"] = owned
+            update[f"tools.$[{name}].already_owned"] = owned
+            array_filters.append({f"{name}.id": {"$in": ids}})
+
+    ids = list(wanted)
+    project_data = await db.projects.find_one_and_update(
+        {"id": project_id, "$or": [{"materials.id": {"$in": ids}}, {"tools.id": {"$in": ids}}]},
+        {"$set": update, "$inc": {"version": 1}},
+        array_filters=array_filters,
+        projection={"_id": 0, "materials.id": 1, "materials.already_owned": 1, "tools.id": 1, "tools.already_owned": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not project_data:
+        if not await db.projects.find_one({"id": project_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Project not found")
+        project_data = {}  # None of the items exist: nothing written
+
+    stored = {
+        item["id"]: item.get("already_owned", False)
+        for item in project_data.get("materials", []) + project_data.get("tools", [])
+    }
+    return [
+        ItemOutcome(item_id=item_id, found=item_id in stored, owned=stored.get(item_id))
+        for item_id in wanted
+    ]
+
+@api_router.post("/projects/{project_id}/items", response_model=UpdateItemsResponse)
+async def update_items_ownership(project_id: str, request: UpdateItemsRequest):
+    """Mark several materials/tools owned or not owned with a single write"""
+    try:
+        if not request.items:
+            raise HTTPException(status_code=400, detail="No items to update")
+        outcomes = await apply_item_changes(project_id, request.items)
+        return UpdateItemsResponse(success=all(outcome.found for outcome in outcomes), items=outcomes)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to update items: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to update items: {str(e)}")
+
 @api_router.post("/projects/{project_id}/toggle-item")
 async def toggle_item_ownership(project_id: str, request: ToggleItemRequest):
     """Toggle whether user owns a material or tool"""
     try:
-        # Optimize: Use atomic update instead of fetch-modify-replace
-        # Try updating in materials array first
-        result = await db.projects.update_one(
-            {"id": project_id, "materials.id": request.item_id},
-            {"$set": {"materials.$.already_owned": request.owned}}
-        )
-        
-        # If not found in materials, try tools array
-        if result.matched_count == 0:
-            result = await db.projects.update_one(
-                {"id": project_id, "tools.id": request.item_id},
-                {"$set": {"tools.$.already_owned": request.owned}}
-            )
-        
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Project or item not found")
+        outcomes = await apply_item_changes(project_id, [request])
+        if not outcomes[0].found:
+            raise HTTPException(status_code=404, detail="Item not found")
 
         return {"success": True, "message": "Item updated"}
 
@@ -499,9 +2333,11 @@ async def toggle_item_ownership(project_id: str, request: ToggleItemRequest):
 async def delete_project(project_id: str):
     """Delete a project"""
     try:
-        result = await db.projects.delete_one({"id": project_id})
-        if result.deleted_count == 0:
+        project_data = await db.projects.find_one_and_delete({"id": project_id})
+        if not project_data:
             raise HTTPException(status_code=404, detail="Project not found")
+        await bump_projects_version()
+        await release_blobs(project_blob_refs(project_data))
         return {"success": True, "message": "Project deleted"}
     except HTTPException:
         raise
@@ -509,28 +2345,128 @@ async def delete_project(project_id: str):
         logger.error(f"Failed to delete project: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to delete project: {str(e)}")
 
+# ============ Step Image Cache ============
+
+# Bump when STEP_IMAGE_PROMPT_TEMPLATE changes so old illustrations are not reused
+STEP_IMAGE_CACHE_VERSION = "step-image-v1"
+
+def normalize_step_text(text: Optional[str]) -> str:
+    """Lowercase, punctuation-free, whitespace-collapsed text for cache keys"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", (text or "").lower()).split())
+
+def hardware_bucket(project_data: Dict) -> str:
+    """Coarse hardware class: the identified hardware's words without model numbers,
+    order-independent, e.g. "Moen 1225 single-handle kitchen faucet" -> "faucet handle kitchen moen single"
+    """
+    words = {
+        word for word in normalize_step_text(project_data.get("hardware_identified")).split()
+        if len(word) > 2 and not any(c.isdigit() for c in word)
+    }
+    return " ".join(sorted(words))
+
+def step_image_cache_key(project_data: Dict, step_data: Dict) -> Optional[str]:
+    if STEP_IMAGE_CACHE_POLICY not in ("context", "generic"):
+        return None
+    parts = [
+        STEP_IMAGE_CACHE_VERSION,
+        IMAGE_MODEL,
+        normalize_step_text(step_data.get("title")),
+        normalize_step_text(step_data.get("image_hint")),
+    ]
+    if STEP_IMAGE_CACHE_POLICY == "context":
+        parts.append(hardware_bucket(project_data))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+class StepImageCache:
+    """Generated step images shared across projects.
+
+    Entries in db.step_image_cache map a prompt key to a blob in the blob store.
+    When their total size exceeds max_bytes the least recently used entries are
+    dropped and their blobs released (unless a project still uses them).
+    Failures are logged and treated as misses so generation never depends on it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            entry = await db.step_image_cache.find_one_and_update(
+                {"key": key},
+                {"$set": {"last_used_at": datetime.utcnow()}, "$inc": {"hits": 1}},
+                projection={"_id": 0, "blob_id": 1},
+            )
+            if entry and not await blob_store.exists(entry["blob_id"]):
+                await db.step_image_cache.delete_one({"key": key})
+                entry = None
+        except Exception as e:
+            logger.error(f"Step image cache lookup failed: {str(e)}")
+            entry = None
+        metrics.incr("step_image_cache.hits" if entry else "step_image_cache.misses")
+        return entry["blob_id"] if entry else None
+
+    async def put(self, key: str, blob_id: str, size: int) -> None:
+        try:
+            now = datetime.utcnow()
+            await db.step_image_cache.update_one(
+                {"key": key},
+                {
+                    "$setOnInsert": {"key": key, "blob_id": blob_id, "size": size, "hits": 0, "created_at": now},
+                    "$set": {"last_used_at": now},
+                },
+                upsert=True,
+            )
+            await self._evict()
+        except Exception as e:
+            logger.error(f"Step image cache store failed: {str(e)}")
+
+    async def _evict(self) -> None:
+        totals = await db.step_image_cache.aggregate(
+            [{"$group": {"_id": None, "bytes": {"$sum": "$size"}, "entries": {"$sum": 1}}}]
+        ).to_list(1)
+        total = totals[0]["bytes"] if totals else 0
+        if total > self.max_bytes:
+            evicted = []
+            async for entry in db.step_image_cache.find({}, {"_id": 0, "key": 1, "blob_id": 1, "size": 1}).sort("last_used_at", ASCENDING):
+                if total <= self.max_bytes:
+                    break
+                await db.step_image_cache.delete_one({"key": entry["key"]})
+                total -= entry["size"]
+                evicted.append(entry["blob_id"])
+            metrics.incr("step_image_cache.evictions", len(evicted))
+            await release_blobs(evicted)
+        metrics.set_gauge("step_image_cache.bytes", total)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate since process start; every hit is an Imagen call avoided"""
+        hits = metrics.counters.get("step_image_cache.hits", 0)
+        misses = metrics.counters.get("step_image_cache.misses", 0)
+        return {
+            "policy": STEP_IMAGE_CACHE_POLICY,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "max_bytes": self.max_bytes,
+        }
+
+step_image_cache = StepImageCache(STEP_IMAGE_CACHE_MAX_BYTES)
+
 # ============ AI Image Generation (Imagen) ============
 
-async def analyze_image_for_context(image_base64: str) -> str:
+async def analyze_image_for_context(image: Optional[Blob]) -> str:
     """Use Gemini to analyze the diagnostic image and extract visual context"""
     try:
-        if not client_genai or not image_base64:
+        if not ai_gateway.available or not image:
             return ""
         
-        # Remove data URL prefix if present
-        if "base64," in image_base64:
-            image_data = image_base64.split("base64,")[1]
-        else:
-            image_data = image_base64
-        
         # Create image part for Gemini
         image_part = types.Part.from_bytes(
-            data=base64.b64decode(image_data),
-            mime_type="image/jpeg"
+            data=image.data,
+            mime_type=image.content_type
         )
         
-        response = client_genai.models.generate_content(
-            model="gemini-3-flash-preview",
+        response = await ai_gateway.generate_content(
+            model=DIAGNOSIS_MODEL,
             contents=[
                 image_part,
                 "Describe this home repair image in detail. Focus on: the specific hardware/fixture (brand style, color, material), the setting (bathroom, kitchen, etc.), visible damage or issues, and surrounding environment. Keep description under 100 words."
@@ -545,10 +2481,46 @@ async def analyze_image_for_context(image_base64: str) -> str:
         logger.warning(f"Image context analysis failed: {str(e)}")
         return ""
 
-async def generate_step_image(step_title: str, step_description: str, project_title: str, image_hint: str = None, image_context: str = None) -> Optional[str]:
+async def project_image_context(project_data: Dict) -> str:
+    """Visual context for step images, stored on the project.
+
+    Normally written by the diagnosis itself; projects without it (or whose
+    image_ref changed since) get one analysis, which is then persisted.
+    """
+    image_ref = project_data.get("image_ref")
+    if project_data.get("image_context") and project_data.get("image_context_ref") == image_ref:
+        metrics.incr("image_context.reused")
+        return project_data["image_context"]
+
+    if not image_ref and "image_base64" not in project_data:
+        # Legacy project read with a projection: fetch the inline original only now
+        legacy = await db.projects.find_one({"id": project_data["id"]}, {"_id": 0, "image_base64": 1})
+        project_data = {**project_data, **(legacy or {})}
+    original_image = await load_project_image(project_data)
+    image_context = await analyze_image_for_context(original_image) if original_image else ""
+    metrics.incr("image_context.computed")
+    if image_context:
+        logger.info(f"Image context extracted: {image_context[:100]}...")
+        await db.projects.update_one(
+            {"id": project_data["id"], "image_ref": image_ref},
+            {"$set": {"image_context": image_context, "image_context_ref": image_ref}, "$inc": {"version": 1}}
+        )
+    return image_context
+
+# Imagen has no context caching, so the fixed parts of the prompt are kept as
+# one template rather than rebuilt per call
+STEP_IMAGE_PROMPT_TEMPLATE = """Technical instructional illustration for DIY home repair.
+Task: {project_title}
+Step: {step_title}
+Action: {step_description}
+{details}
+Style: Clean, photorealistic hands-on tutorial image showing the repair action clearly. 
+Well-lit, professional instructional photo style. No text overlays."""
+
+async def generate_step_image(step_title: str, step_description: str, project_title: str, image_hint: str = None, image_context: str = None) -> Optional[Blob]:
     """Generate an instructional image for a repair step using Imagen"""
     try:
-        if not client_genai:
+        if not ai_gateway.available:
             logger.warning("GenAI client not initialized")
             return None
         
@@ -556,19 +2528,18 @@ async def generate_step_image(step_title: str, step_description: str, project_ti
         hint_text = f" Focus on: {image_hint}." if image_hint else ""
         context_text = f" Visual context from the actual repair: {image_context[:150]}." if image_context else ""
         
-        prompt = f"""Technical instructional illustration for DIY home repair.
-Task: {project_title}
-Step: {step_title}
-Action: {step_description[:200]}
-{hint_text}{context_text}
-Style: Clean, photorealistic hands-on tutorial image showing the repair action clearly. 
-Well-lit, professional instructional photo style. No text overlays."""
+        prompt = STEP_IMAGE_PROMPT_TEMPLATE.format(
+            project_title=project_title,
+            step_title=step_title,
+            step_description=step_description[:200],
+            details=f"{hint_text}{context_text}",
+        )
 
         logger.info(f"Generating image for step: {step_title}")
         
         # Use Imagen to generate image
-        response = client_genai.models.generate_images(
-            model='imagen-4.0-generate-001',
+        response = await ai_gateway.generate_images(
+            model=IMAGE_MODEL,
             prompt=prompt,
             config=types.GenerateImagesConfig(
                 number_of_images=1,
@@ -584,33 +2555,21 @@ Well-lit, professional instructional photo style. No text overlays."""
                 # Access image bytes via nested property: generated_image.image.image_bytes
                 image_bytes = generated_image.image.image_bytes
                 
-                # Load into PIL Image for optional processing
-                pil_image = Image.open(io.BytesIO(image_bytes))
-                
-                # Resize for mobile optimization
-                pil_image.thumbnail((800, 600), Image.Resampling.LANCZOS)
-                
-                # Convert back to bytes
-                buffered = io.BytesIO()
-                pil_image.save(buffered, format="JPEG", quality=80)
-                img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                
-                return f"data:image/jpeg;base64,{img_base64}"
+                # Resize for mobile optimization and re-encode off the event loop
+                return Blob(await run_image_job(encode_generated_image, image_bytes), "image/jpeg")
                 
             except AttributeError as attr_err:
                 # Fallback: try direct image_bytes on generated_image
                 logger.warning(f"Nested image_bytes not found, trying alternatives: {attr_err}")
                 
                 if hasattr(generated_image, 'image_bytes'):
-                    img_base64 = base64.b64encode(generated_image.image_bytes).decode('utf-8')
-                    return f"data:image/png;base64,{img_base64}"
+                    return Blob(generated_image.image_bytes, "image/png")
                 
                 # Try _pil_image (undocumented fallback)
                 if hasattr(generated_image, '_pil_image'):
                     buffered = io.BytesIO()
                     generated_image._pil_image.save(buffered, format="JPEG", quality=80)
-                    img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                    return f"data:image/jpeg;base64,{img_base64}"
+                    return Blob(buffered.getvalue(), "image/jpeg")
                 
                 logger.error(f"Could not extract image bytes. Available attrs: {dir(generated_image)}")
                 return None
@@ -625,6 +2584,372 @@ Well-lit, professional instructional photo style. No text overlays."""
         logger.error(f"Image generation error: {str(e)}")
         return None
 
+async def generate_images_for_step(
+    project_id: str, step_id: str, loaded: Optional[Tuple[Dict, Dict]] = None
+) -> List[str]:
+    """Generate and store the image for one step; returns its image URLs ([] on failure).
+
+    `loaded` is the (project fields, step) pair when the caller already read them.
+    """
+    project_data, step_data = loaded or await find_project_step(project_id, step_id, STEP_IMAGE_PROJECT_FIELDS)
+
+    existing_images = step_image_urls(step_data)
+    if existing_images:
+        return existing_images
+
+    # Visual context stored by the diagnosis (analyzed from the photo only if missing)
+    logger.info(f"Generating images for project {project_id}, step {step_id}")
+    image_context = await project_image_context(project_data)
+    return await render_step_image(project_data, step_data, image_context)
+
+async def render_step_image(project_data: Dict, step_data: Dict, image_context: str) -> List[str]:
+    """Generate (or reuse from the step image cache), store and attach one step's image;
+    returns its image URLs ([] on failure)"""
+    cache_key = step_image_cache_key(project_data, step_data)
+    image_ref = await step_image_cache.get(cache_key) if cache_key else None
+    if image_ref:
+        logger.info(f"Reusing cached image for step: {step_data.get('title', '')}")
+    else:
+        generated = await generate_step_image(
+            step_title=step_data.get("title", ""),
+            step_description=step_data.get("description", ""),
+            project_title=project_data.get("title", ""),
+            image_hint=step_data.get("image_hint", ""),
+            image_context=image_context
+        )
+        if not generated:
+            return []
+
+        image_ref = await blob_store.put(generated.data, generated.content_type)
+        if cache_key:
+            await step_image_cache.put(cache_key, image_ref, len(generated.data))
+
+    await db.projects.update_one(
+        {"id": project_data["id"], "steps.id": step_data["id"]},
+        {"$set": {
+            "steps.$.generated_image_refs": [image_ref],
+            "steps.$.images_generating": False
+        }, "$inc": {"version": 1}}
+    )
+    return [image_url(image_ref)]
+
+# ============ Step Image Jobs ============
+
+IMAGE_JOB_FINISHED = {"succeeded", "failed"}
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 10
+
+class ImageJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    project_id: str
+    step_id: str
+    status: str = "queued"  # queued -> running -> succeeded | failed
+    priority: int = PRIORITY_INTERACTIVE  # Lower runs first
+    active: bool = True  # Queued or running; at most one active job per step
+    attempts: int = 0
+    owner: Optional[str] = None  # Process running the job
+    images: List[str] = []
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+class ImageJobQueue:
+    """Step-image jobs persisted in db.image_jobs and run by a fixed pool of worker tasks.
+
+    Jobs outlive the request that created them: a client that disconnects can
+    poll GET /api/jobs/{id} or reopen its event stream and still get the images.
+    Claiming is atomic, so several processes can share the queue. A running
+    job's updated_at is refreshed every IMAGE_JOB_HEARTBEAT seconds; a reaper
+    requeues jobs that went IMAGE_JOB_STALE_AFTER without one (their process
+    died), and a clean shutdown hands its running jobs back right away.
+
+    Speculative prefetch jobs (priority >= PRIORITY_PREFETCH) have their own
+    small lane that only starts work while no interactive job is waiting, and an
+    interactive request for a step promotes its queued prefetch job.
+    """
+
+    def __init__(self, workers: int, prefetch_workers: int):
+        self.workers = workers
+        self.prefetch_workers = prefetch_workers
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._prefetch_queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()  # FIFO within a priority
+        self._watchers: Dict[str, set] = defaultdict(set)
+        self._prefetch_started: deque = deque()  # monotonic times, for the hourly budget
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def start(self) -> None:
+        """Start the workers and the reaper; persisted jobs are recovered in the
+        background so an unreachable database does not keep the app from starting"""
+        self._queue = asyncio.PriorityQueue()
+        self._prefetch_queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks += [asyncio.create_task(self._prefetch_worker()) for _ in range(self.prefetch_workers)]
+        self._tasks.append(asyncio.create_task(self._reap(datetime.utcnow())))
+        logger.info(f"Started {self.workers} image job workers")
+
+    async def _reap(self, started_at: datetime) -> None:
+        """Queue jobs left queued before `started_at` by a previous process, then keep
+        requeueing abandoned ones; failures are logged and retried on the next round"""
+        recovered = False
+        while True:
+            try:
+                if not recovered:
+                    count = 0
+                    left_queued = {"status": "queued", "updated_at": {"$lt": started_at}}
+                    async for job in db.image_jobs.find(left_queued, {"_id": 0, "id": 1, "priority": 1}):
+                        self._put(job["id"], job.get("priority", PRIORITY_INTERACTIVE))
+                        count += 1
+                    recovered = True
+                    logger.info(f"Recovered {count} image jobs")
+                for job in await self._requeue_stale({}):
+                    self._put(job["id"], job.get("priority", PRIORITY_INTERACTIVE))
+                    metrics.incr("image_jobs.reaped")
+            except Exception as e:
+                logger.error(f"Image job reaper failed, retrying in {IMAGE_JOB_REAP_INTERVAL:g}s: {str(e)}")
+            await asyncio.sleep(IMAGE_JOB_REAP_INTERVAL)
+
+    async def stop(self) -> None:
+        """Cancel the workers and hand this process's running jobs back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            result = await db.image_jobs.update_many(
+                {"owner": self.owner, "status": "running"},
+                {"$set": {"status": "queued", "owner": None, "updated_at": datetime.utcnow()}},
+            )
+            if result.modified_count:
+                logger.info(f"Requeued {result.modified_count} interrupted image jobs")
+        except Exception as e:
+            logger.error(f"Failed to requeue interrupted image jobs: {str(e)}")
+
+    async def _requeue_stale(self, query: Dict) -> List[Dict]:
+        """Move jobs that went IMAGE_JOB_STALE_AFTER without progress back to queued:
+        running jobs whose worker stopped heartbeating and queued jobs whose process
+        died before running them. Returns the jobs to put on the local queue."""
+        stale_filter = {
+            **query,
+            "status": {"$in": ["queued", "running"]},
+            "updated_at": {"$lt": datetime.utcnow() - timedelta(seconds=IMAGE_JOB_STALE_AFTER)},
+        }
+        jobs = [job async for job in db.image_jobs.find(stale_filter, {"_id": 0, "id": 1, "priority": 1})]
+        if jobs:
+            await db.image_jobs.update_many(
+                {**stale_filter, "id": {"$in": [job["id"] for job in jobs]}},
+                {"$set": {"status": "queued", "owner": None, "updated_at": datetime.utcnow()}},
+            )
+        return jobs
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(IMAGE_JOB_HEARTBEAT)
+            try:
+                await db.image_jobs.update_one(
+                    {"id": job_id, "status": "running", "owner": self.owner},
+                    {"$set": {"updated_at": datetime.utcnow()}},
+                )
+            except Exception as e:
+                logger.warning(f"Image job {job_id} heartbeat failed: {str(e)}")
+
+    def _put(self, job_id: str, priority: int) -> None:
+        queue = self._prefetch_queue if priority >= PRIORITY_PREFETCH else self._queue
+        queue.put_nowait((priority, next(self._sequence), job_id))
+        metrics.set_gauge("image_jobs.queued", self._queue.qsize())
+        metrics.set_gauge("image_jobs.prefetch_queued", self._prefetch_queue.qsize())
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await db.image_jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def enqueue(
+        self, project_id: str, step_id: str, priority: int = PRIORITY_INTERACTIVE, dispatch: bool = True
+    ) -> Dict:
+        """Queue image generation for a step, or return the step's already active job.
+
+        With dispatch=False the new job is recorded but not handed to the workers:
+        the caller runs it (see run_batch), and the reaper requeues it if that
+        caller's process dies first.
+        """
+        job = ImageJob(project_id=project_id, step_id=step_id, priority=priority).dict()
+        try:
+            await db.image_jobs.insert_one(job)
+        except DuplicateKeyError:
+            active = await db.image_jobs.find_one(
+                {"project_id": project_id, "step_id": step_id, "active": True}, {"_id": 0}
+            )
+            if active:
+                metrics.incr("image_jobs.deduplicated")
+                if await self._requeue_stale({"id": active["id"]}):
+                    self._put(active["id"], active.get("priority", PRIORITY_INTERACTIVE))
+                elif priority < active.get("priority", PRIORITY_INTERACTIVE):
+                    # Promote a still-queued prefetch job; the stale lane entry is skipped when claimed
+                    promoted = await db.image_jobs.update_one(
+                        {"id": active["id"], "status": "queued"}, {"$set": {"priority": priority}}
+                    )
+                    if promoted.modified_count:
+                        active["priority"] = priority
+                        self._put(active["id"], priority)
+                        metrics.incr("image_jobs.promoted")
+                return active
+            raise
+        job.pop("_id", None)
+        await db.projects.update_one(
+            {"id": project_id, "steps.id": step_id},
+            {"$set": {"steps.$.images_generating": True}, "$inc": {"version": 1}}
+        )
+        if dispatch:
+            self._put(job["id"], priority)
+        metrics.incr("image_jobs.enqueued")
+        return job
+
+    async def prefetch(self, project: Project) -> None:
+        """Speculatively queue the first IMAGE_PREFETCH_STEPS steps of a new project,
+        within the global IMAGE_PREFETCH_BUDGET (steps per hour)"""
+        if IMAGE_PREFETCH_STEPS <= 0 or self._prefetch_queue is None:
+            return
+        now = time.monotonic()
+        while self._prefetch_started and now - self._prefetch_started[0] > 3600:
+            self._prefetch_started.popleft()
+
+        steps = project.steps[:IMAGE_PREFETCH_STEPS]
+        allowed = max(0, IMAGE_PREFETCH_BUDGET - len(self._prefetch_started))
+        if allowed < len(steps):
+            metrics.incr("image_jobs.prefetch_over_budget", len(steps) - allowed)
+        try:
+            for step in steps[:allowed]:
+                self._prefetch_started.append(now)
+                await self.enqueue(project.id, step.id, PRIORITY_PREFETCH)
+        except Exception as e:
+            logger.error(f"Image prefetch for project {project.id} failed: {str(e)}")
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            metrics.set_gauge("image_jobs.queued", self._queue.qsize())
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Image job {job_id} crashed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _prefetch_worker(self) -> None:
+        while True:
+            _, _, job_id = await self._prefetch_queue.get()
+            metrics.set_gauge("image_jobs.prefetch_queued", self._prefetch_queue.qsize())
+            # Interactive work goes first: only start while none is waiting
+            while not self._queue.empty():
+                await asyncio.sleep(IMAGE_PREFETCH_BACKOFF)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Image job {job_id} crashed: {str(e)}")
+            finally:
+                self._prefetch_queue.task_done()
+
+    async def _run(self, job_id: str, loaded: Optional[Tuple[Dict, Dict]] = None) -> None:
+        job = await db.image_jobs.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "owner": self.owner, "updated_at": datetime.utcnow()},
+             "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not job:
+            return  # Claimed by another worker or process
+        self._publish(job)
+
+        started_at = time.monotonic()
+        result = {"status": "failed", "images": [], "error": None}
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            images = await generate_images_for_step(job["project_id"], job["step_id"], loaded)
+            if images:
+                result.update(status="succeeded", images=images)
+            else:
+                result["error"] = "Failed to generate image"
+        except HTTPException as e:
+            result["error"] = e.detail
+        except Exception as e:
+            logger.error(f"Image job {job_id} failed: {str(e)}")
+            result["error"] = f"Failed to generate images: {str(e)}"
+        finally:
+            heartbeat.cancel()
+
+        await db.projects.update_one(
+            {"id": job["project_id"], "steps": {"$elemMatch": {"id": job["step_id"], "images_generating": True}}},
+            {"$set": {"steps.$.images_generating": False}, "$inc": {"version": 1}}
+        )
+        now = datetime.utcnow()
+        job = await db.image_jobs.find_one_and_update(
+            {"id": job_id, "owner": self.owner},  # Unless it was reaped meanwhile
+            {"$set": {**result, "active": False, "updated_at": now, "finished_at": now}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        metrics.incr(f"image_jobs.{result['status']}")
+        metrics.observe("image_jobs.run_seconds", time.monotonic() - started_at)
+        if job:
+            self._publish(job)
+
+    def _publish(self, job: Dict) -> None:
+        for updates in self._watchers.get(job["id"], ()):
+            updates.put_nowait(job)
+
+    async def watch(self, job_id: str):
+        """Yield the job's state now and after every change until it finishes"""
+        updates: asyncio.Queue = asyncio.Queue()
+        self._watchers[job_id].add(updates)
+        try:
+            job = await self.get(job_id)
+            while job:
+                yield job
+                if job["status"] in IMAGE_JOB_FINISHED:
+                    return
+                try:
+                    job = await asyncio.wait_for(updates.get(), timeout=IMAGE_JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    job = await self.get(job_id)
+        finally:
+            self._watchers[job_id].discard(updates)
+            if not self._watchers[job_id]:
+                del self._watchers[job_id]
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """The job's latest state once it finishes or `timeout` elapses"""
+        latest = None
+
+        async def follow():
+            nonlocal latest
+            async for job in self.watch(job_id):
+                latest = job
+
+        try:
+            await asyncio.wait_for(follow(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return latest
+
+    async def run_batch(self, project_data: Dict, jobs: List[Dict], concurrency: int, timeout: float) -> List[Dict]:
+        """Run one project's undispatched jobs in the caller's task, `concurrency` at
+        a time, using the project and steps the caller already read; returns their
+        latest states in order. Jobs a worker or another request already claimed
+        are waited on instead of run again."""
+        steps = {step["id"]: step for step in project_data.get("steps", [])}
+        limit = asyncio.Semaphore(concurrency)
+
+        async def run(job: Dict) -> Dict:
+            async with limit:
+                await self._run(job["id"], (project_data, steps[job["step_id"]]))
+            return await self.wait(job["id"], timeout) or job
+
+        return await asyncio.gather(*(run(job) for job in jobs))
+
+image_jobs = ImageJobQueue(IMAGE_JOB_WORKERS, IMAGE_PREFETCH_WORKERS)
+
 class GenerateStepImagesRequest(BaseModel):
     step_id: str
 
@@ -633,124 +2958,387 @@ class StepImagesResponse(BaseModel):
     images: List[str]
     success: bool
     message: str = ""
+    job_id: Optional[str] = None  # Poll /api/jobs/{job_id} while generation is pending
+    status: Optional[str] = None  # Job status, or "generating" for a step with an active job
+
+def job_images_response(job: Dict) -> StepImagesResponse:
+    messages = {
+        "queued": "Image generation queued",
+        "running": "Image generation in progress",
+        "succeeded": "Image generated successfully",
+    }
+    return StepImagesResponse(
+        step_id=job["step_id"],
+        images=job.get("images", []),
+        success=job["status"] == "succeeded",
+        message=messages.get(job["status"]) or job.get("error") or "Failed to generate image",
+        job_id=job["id"],
+        status=job["status"],
+    )
 
 @api_router.post("/projects/{project_id}/steps/{step_id}/generate-images", response_model=StepImagesResponse)
-async def generate_step_images(project_id: str, step_id: str):
-    """Generate AI images for a specific step (on-demand)"""
+async def generate_step_images(project_id: str, step_id: str, wait: bool = Query(default=True)):
+    """Queue AI image generation for a step (on-demand).
+
+    With wait=true the response carries the images once the job finishes (up to
+    IMAGE_JOB_WAIT_TIMEOUT); with wait=false it returns the job id to poll right
+    away. Either way the job runs to completion if the client goes away.
+    """
     try:
-        # Fetch the project
-        project_data = await db.projects.find_one({"id": project_id})
-        if not project_data:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        # Find the specific step
-        step_data = None
-        step_index = -1
-        for idx, step in enumerate(project_data.get("steps", [])):
-            if step.get("id") == step_id:
-                step_data = step
-                step_index = idx
-                break
-        
-        if not step_data:
-            raise HTTPException(status_code=404, detail="Step not found")
-        
-        # Check if images already exist
-        existing_images = step_data.get("generated_images", [])
-        if existing_images and len(existing_images) > 0:
+        _, step_data = await find_project_step(project_id, step_id)
+
+        existing_images = step_image_urls(step_data)
+        if existing_images:
             return StepImagesResponse(
                 step_id=step_id,
                 images=existing_images,
                 success=True,
                 message="Images already generated"
             )
-        
-        # Analyze the original diagnostic image for context
-        logger.info(f"Generating images for project {project_id}, step {step_id}")
-        original_image = project_data.get("image_base64", "")
-        image_context = await analyze_image_for_context(original_image) if original_image else ""
-        
-        if image_context:
-            logger.info(f"Image context extracted: {image_context[:100]}...")
-        
-        # Generate image with context from original photo
-        image_base64 = await generate_step_image(
-            step_title=step_data.get("title", ""),
-            step_description=step_data.get("description", ""),
-            project_title=project_data.get("title", ""),
-            image_hint=step_data.get("image_hint", ""),
-            image_context=image_context
-        )
-        
-        if image_base64:
-            generated_images = [image_base64]
-            
-            # Update the step in database
-            await db.projects.update_one(
-                {"id": project_id, "steps.id": step_id},
-                {"$set": {
-                    "steps.$.generated_images": generated_images,
-                    "steps.$.images_generating": False
-                }}
-            )
-            
-            return StepImagesResponse(
-                step_id=step_id,
-                images=generated_images,
-                success=True,
-                message="Image generated successfully"
-            )
-        else:
-            return StepImagesResponse(
-                step_id=step_id,
-                images=[],
-                success=False,
-                message="Failed to generate image"
-            )
-            
+
+        job = await image_jobs.enqueue(project_id, step_id)
+        if wait:
+            job = await image_jobs.wait(job["id"], IMAGE_JOB_WAIT_TIMEOUT) or job
+        return job_images_response(job)
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Generate step images error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate images: {str(e)}")
 
-@api_router.get("/projects/{project_id}/steps/{step_id}/images", response_model=StepImagesResponse)
-async def get_step_images(project_id: str, step_id: str):
-    """Get generated images for a step (returns cached if available)"""
+class ProjectImagesResponse(BaseModel):
+    project_id: str
+    steps: List[StepImagesResponse]  # In step order
+    success: bool  # Every step has images
+
+@api_router.post("/projects/{project_id}/generate-images", response_model=ProjectImagesResponse)
+async def generate_project_images(project_id: str):
+    """Generate AI images for every step that does not have them yet.
+
+    The project is read and the photo analyzed once. Each pending step gets an
+    image job, so concurrent single-step requests for the same steps coalesce onto
+    it; this request runs the jobs itself, STEP_IMAGE_FANOUT at a time (they are
+    not handed to the job workers). Jobs still unfinished after
+    IMAGE_JOB_WAIT_TIMEOUT are reported with their job id to poll.
+    """
     try:
-        project_data = await db.projects.find_one({"id": project_id})
+        projection = {"_id": 0, "id": 1, "steps": 1, **{field: 1 for field in STEP_IMAGE_PROJECT_FIELDS}}
+        project_data = await db.projects.find_one({"id": project_id}, projection)
         if not project_data:
             raise HTTPException(status_code=404, detail="Project not found")
-        
-        for step in project_data.get("steps", []):
-            if step.get("id") == step_id:
-                images = step.get("generated_images", [])
-                return StepImagesResponse(
-                    step_id=step_id,
-                    images=images,
-                    success=len(images) > 0,
-                    message="Images retrieved" if images else "No images generated yet"
+
+        steps = project_data.get("steps", [])
+        results: Dict[str, StepImagesResponse] = {}
+        pending = []
+        for step in steps:
+            existing_images = step_image_urls(step)
+            if existing_images:
+                results[step["id"]] = StepImagesResponse(
+                    step_id=step["id"],
+                    images=existing_images,
+                    success=True,
+                    message="Images already generated"
                 )
-        
-        raise HTTPException(status_code=404, detail="Step not found")
-        
+            else:
+                pending.append(step)
+
+        if pending:
+            logger.info(f"Generating images for {len(pending)} steps of project {project_id}")
+            started_at = time.monotonic()
+            # Analyze the photo once up front; every job reuses the context
+            project_data["image_context"] = await project_image_context(project_data)
+            project_data["image_context_ref"] = project_data.get("image_ref")
+            jobs = [await image_jobs.enqueue(project_id, step["id"], dispatch=False) for step in pending]
+            # Shield so a client disconnect does not throw away Imagen work in progress
+            jobs = await asyncio.shield(asyncio.ensure_future(
+                image_jobs.run_batch(project_data, jobs, STEP_IMAGE_FANOUT, IMAGE_JOB_WAIT_TIMEOUT)
+            ))
+            metrics.observe("step_images.bulk_seconds", time.monotonic() - started_at)
+            results.update({job["step_id"]: job_images_response(job) for job in jobs})
+
+        ordered = [results[step["id"]] for step in steps]
+        return ProjectImagesResponse(
+            project_id=project_id,
+            steps=ordered,
+            success=all(result.success for result in ordered)
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Generate project images error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate images: {str(e)}")
+
+@api_router.get("/jobs/{job_id}", response_model=ImageJob)
+async def get_image_job(job_id: str):
+    """Poll a step image job"""
+    job = await image_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return ImageJob(**job)
+
+@api_router.get("/jobs/{job_id}/events")
+async def image_job_events(job_id: str):
+    """Server-sent `job` events with the job's state on every change, until it finishes"""
+    if not await image_jobs.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for job in image_jobs.watch(job_id):
+            yield sse_event("job", json.loads(ImageJob(**job).json()))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/projects/{project_id}/steps/{step_id}/images", response_model=StepImagesResponse)
+async def get_step_images(project_id: str, step_id: str):
+    """Get generated images for a step (returns cached if available)"""
+    try:
+        _, step = await find_project_step(project_id, step_id)
+
+        images = step_image_urls(step)
+        generating = not images and step.get("images_generating", False)
+        return StepImagesResponse(
+            step_id=step_id,
+            images=images,
+            success=len(images) > 0,
+            message="Images retrieved" if images else (
+                "Images are being generated" if generating else "No images generated yet"
+            ),
+            status="generating" if generating else None
+        )
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Get step images error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get images: {str(e)}")
 
+# ============ Image Serving ============
+
+@api_router.get("/images/{blob_id}")
+async def get_image(
+    blob_id: str,
+    w: Optional[int] = Query(default=None, ge=1, le=4096),
+    format: Optional[str] = Query(default=None, pattern="^(jpeg|webp)$"),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Serve raw image bytes by content hash, optionally as a resized variant.
+
+    Blobs are content-addressed so responses never change: strong ETags and
+    immutable caching let clients and CDNs skip re-downloading entirely.
+    """
+    try:
+        width = snap_variant_width(w) if w else None
+        image_format = format or ("jpeg" if width else None)
+        if not image_format:
+            etag = f'"{blob_id}"'
+        elif width:
+            etag = f'"{blob_id}-w{width}.{image_format}"'
+        else:
+            etag = f'"{blob_id}.{image_format}"'  # Source width, only re-encoded
+        headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+
+        if etag_matches(if_none_match, etag):
+            metrics.incr("images.not_modified")
+            return Response(status_code=304, headers=headers)
+
+        if image_format:
+            blob = await get_image_variant(blob_id, width, image_format)
+        else:
+            blob = await blob_store.get(blob_id)
+        if not blob:
+            raise HTTPException(status_code=404, detail="Image not found")
+
+        metrics.incr("images.served")
+        metrics.incr("images.served_bytes", len(blob.data))
+        return Response(content=blob.data, media_type=blob.content_type, headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to serve image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to serve image: {str(e)}")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=UPLOAD_MAX_BYTES, paths=UPLOAD_LIMITED_PATHS)
+
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, encodings=COMPRESSION_ENCODINGS, min_size=COMPRESSION_MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+@app.on_event("startup")
+async def reconcile_indexes():
+    if not MANAGE_INDEXES:
+        return
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Index reconciliation failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_image_jobs():
+    try:
+        await image_jobs.start()
+    except Exception as e:
+        logger.error(f"Starting image job workers failed: {str(e)}")
+
+@app.on_event("shutdown")
+async def stop_image_jobs():
+    await image_jobs.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+@app.on_event("shutdown")
+async def shutdown_image_pool():
+    if image_pool is not None:
+        image_pool.shutdown(wait=False, cancel_futures=True)
+
+async def migrate_all_inline_images() -> Dict[str, int]:
+    migrated = 0
+    async for project in db.projects.find(LEGACY_INLINE_IMAGES_FILTER, {"_id": 0, "id": 1}):
+        migrated += await migrate_inline_images(project["id"])
+    return {"migrated": migrated}
+
+# ============ Benchmarks ============
+
+async def benchmark_step_reads(steps: int, image_kb: int) -> Dict[str, Any]:
+    """BSON bytes MongoDB returns for one step's image reads: whole document vs projection.
+
+    Uses a throwaway legacy-style project (inline original and per-step base64
+    images, the worst case) in a scratch collection that is dropped afterwards,
+    so it never shows up in project listings or ETags.
+    """
+    def inline_image(kb: int) -> str:
+        return base64.b64encode(os.urandom(kb * 1024)).decode("ascii")
+
+    collection = db[f"bench_{uuid.uuid4().hex}"]
+    project_id = f"benchmark-{uuid.uuid4()}"
+    step_ids = [str(uuid.uuid4()) for _ in range(steps)]
+    await collection.insert_one({
+        "id": project_id,
+        "title": "Benchmark project",
+        "hardware_identified": "Benchmark faucet",
+        "image_base64": inline_image(image_kb),
+        "steps": [
+            {"id": step_id, "step_number": n + 1, "title": f"Step {n + 1}", "description": "Benchmark step",
+             "generated_images": [inline_image(max(1, image_kb // 8))]}
+            for n, step_id in enumerate(step_ids)
+        ],
+        "created_at": datetime.utcnow(),
+    })
+    try:
+        step_id = step_ids[steps // 2]
+        full = await collection.find_one({"id": project_id})
+        get_step, _ = await find_project_step(project_id, step_id, collection=collection)
+        generate_step, _ = await find_project_step(project_id, step_id, STEP_IMAGE_PROJECT_FIELDS, collection)
+        full_bytes = len(bson.encode(full))
+        return {
+            "steps": steps,
+            "image_kb": image_kb,
+            "full_document_bytes": full_bytes,
+            "get_step_images_bytes": len(bson.encode(get_step)),
+            "generate_step_images_bytes": len(bson.encode(generate_step)),
+            "generate_step_images_reduction": round(1 - len(bson.encode(generate_step)) / full_bytes, 4),
+        }
+    finally:
+        await collection.drop()
+
+def benchmark_project_serialization(steps: int, image_kb: int, rounds: int) -> Dict[str, Any]:
+    """Time and peak allocations to render one project response: the validated
+    model path (Project + jsonable_encoder + json) vs trusted_payload + FastJSONResponse.
+
+    "inline" steps carry base64 generated images (legacy documents, the multi-MB
+    case); "refs" steps carry blob refs as current documents do.
+    """
+    import tracemalloc
+    from fastapi.encoders import jsonable_encoder
+
+    def sample_project(inline: bool) -> Dict:
+        image = base64.b64encode(os.urandom(image_kb * 1024)).decode("ascii")
+        project = build_project({
+            "title": "Benchmark project",
+            "description": "Replace the cartridge of a leaking single-handle faucet. " * 4,
+            "skill_level": 2,
+            "hardware_identified": "Single-handle kitchen faucet",
+            "issue_type": "Leak",
+            "safety_warnings": ["Turn off the water supply"],
+            "steps": [
+                {"step_number": n + 1, "title": f"Step {n + 1}", "description": "Detailed instructions. " * 20,
+                 "image_hint": "Close-up of the valve"}
+                for n in range(steps)
+            ],
+            "materials": [{"name": f"Material {n}", "estimated_cost": "$5-10"} for n in range(8)],
+            "tools": [{"name": f"Tool {n}", "estimated_cost": "varies"} for n in range(6)],
+        }, blob_hash(b"image"), blob_hash(b"thumbnail")).dict()
+        for step in project["steps"]:
+            if inline:
+                step["generated_images"] = [image]
+            else:
+                step["generated_image_refs"] = [blob_hash(step["id"].encode("utf-8"))]
+        return project
+
+    # attach_image_urls only (re)sets derived fields, so both paths can share one document
+    def validated(document: Dict) -> bytes:
+        model = ProjectResponse(project=Project(**attach_image_urls(document)))
+        return JSONResponse(jsonable_encoder(model)).body
+
+    def trusted(document: Dict) -> bytes:
+        return FastJSONResponse({"project": project_payload(document)}).body
+
+    def measure(render, document: Dict) -> Dict[str, float]:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            body = render(document)
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        render(document)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"ms_per_response": round(elapsed / rounds * 1000, 3), "peak_alloc_kb": round(peak / 1024, 1),
+                "body_kb": round(len(body) / 1024, 1)}
+
+    report: Dict[str, Any] = {"steps": steps, "image_kb": image_kb, "rounds": rounds, "orjson": orjson is not None}
+    for scenario in ("inline", "refs"):
+        document = sample_project(scenario == "inline")
+        report[scenario] = {"validated": measure(validated, document), "trusted": measure(trusted, document)}
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DIY Home Repair backend maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    indexes_parser = subcommands.add_parser("indexes", help="Reconcile MongoDB indexes")
+    indexes_parser.add_argument("--dry-run", action="store_true", help="Report differences without creating indexes")
+    subcommands.add_parser("migrate-inline-images", help="Move legacy inline base64 images into the blob store")
+    step_reads_parser = subcommands.add_parser("bench-step-reads", help="Measure bytes read per step image request")
+    step_reads_parser.add_argument("--steps", type=int, default=10)
+    step_reads_parser.add_argument("--image-kb", type=int, default=2048, help="Size of the inline original image")
+    json_parser = subcommands.add_parser("bench-json", help="Compare project response serialization paths")
+    json_parser.add_argument("--steps", type=int, default=10)
+    json_parser.add_argument("--image-kb", type=int, default=256, help="Size of each inline generated image")
+    json_parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "indexes":
+        print(json.dumps(asyncio.run(ensure_indexes(dry_run=args.dry_run)), indent=2))
+    elif args.command == "migrate-inline-images":
+        print(json.dumps(asyncio.run(migrate_all_inline_images()), indent=2))
+    elif args.command == "bench-step-reads":
+        print(json.dumps(asyncio.run(benchmark_step_reads(args.steps, args.image_kb)), indent=2))
+    elif args.command == "bench-json":
+        print(json.dumps(benchmark_project_serialization(args.steps, args.image_kb, args.rounds), indent=2))
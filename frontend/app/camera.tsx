@@ -25,6 +25,8 @@ export default function CameraScreen() {
   const [zoom, setZoom] = useState(0); 
   const [mode, setMode] = useState<CameraMode>('picture');
   const [isRecording, setIsRecording] = useState(false);
+  // One key per capture + description so timeout retries reuse the in-flight analysis
+  const idempotencyKey = useRef<string | null>(null);
   
   const cameraRef = useRef<CameraView>(null);
   const router = useRouter();
@@ -192,9 +194,16 @@ export default function CameraScreen() {
     }
   };
 
+  useEffect(() => {
+    idempotencyKey.current = null;
+  }, [capturedImage, capturedVideo, description]);
+
   const uploadAndAnalyze = async () => {
       if (!capturedImage && !capturedVideo) return;
       
+      if (!idempotencyKey.current) {
+        idempotencyKey.current = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+      }
       setAnalyzing(true);
       try {
           const formData = new FormData();
@@ -231,6 +240,7 @@ export default function CameraScreen() {
                   {
                       headers: {
                           'Content-Type': 'multipart/form-data',
+                          'Idempotency-Key': idempotencyKey.current,
                       },
                       timeout: 180000, // 3 mins for video
                   }
@@ -246,7 +256,10 @@ export default function CameraScreen() {
                       description: description || undefined,
                   },
                   {
-                      headers: { 'Content-Type': 'application/json' },
+                      headers: {
+                          'Content-Type': 'application/json',
+                          'Idempotency-Key': idempotencyKey.current,
+                      },
                       timeout: 120000, 
                   }
               );
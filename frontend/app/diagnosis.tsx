@@ -4,6 +4,7 @@ import { useLocalSearchParams, useRouter } from 'expo-router';
 import { SafeAreaView } from 'react-native-safe-area-context';
 import { MaterialIcons } from '@expo/vector-icons';
 import axios from 'axios';
+import { resolveImageUri } from '../utils/imageUri';
 
 const EXPO_PUBLIC_BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
 const HOUZZ_GREEN = '#3dae2b';
@@ -16,6 +17,7 @@ interface Project {
   skill_level_name: string;
   estimated_time: string;
   image_base64: string;
+  image_url?: string;
   hardware_identified: string;
   issue_type: string;
   safety_warnings: string[];
@@ -76,7 +78,7 @@ export default function DiagnosisScreen() {
         {/* Image Preview */}
         <View style={styles.imageContainer}>
             <Image 
-            source={{ uri: project.image_base64.startsWith('data:') ? project.image_base64 : `data:image/jpeg;base64,${project.image_base64}` }} 
+            source={{ uri: resolveImageUri(project.image_url || project.image_base64, 800) }} 
             style={styles.headerImage}
             />
             <View style={styles.overlay} />
@@ -4,6 +4,8 @@ import { useRouter } from 'expo-router';
 import { SafeAreaView } from 'react-native-safe-area-context';
 import { MaterialIcons } from '@expo/vector-icons';
 import axios from 'axios';
+import { resolveImageUri } from '../utils/imageUri';
+import { conditionalGet } from '../utils/conditionalGet';
 
 const EXPO_PUBLIC_BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
 const HOUZZ_GREEN = '#3dae2b';
@@ -15,8 +17,10 @@ interface Project {
   skill_level: number;
   skill_level_name: string;
   estimated_time: string;
-  image_base64: string;
+  image_base64?: string;
   thumbnail_base64?: string;
+  image_url?: string;
+  thumbnail_url?: string;
   hardware_identified: string;
   issue_type: string;
   created_at: string;
@@ -27,6 +31,8 @@ export default function HistoryScreen() {
   const [projects, setProjects] = useState<Project[]>([]);
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchProjects();
@@ -34,8 +40,9 @@ export default function HistoryScreen() {
 
   const fetchProjects = async () => {
     try {
-      const response = await axios.get(`${EXPO_PUBLIC_BACKEND_URL}/api/projects`);
-      setProjects(response.data.projects);
+      const data = await conditionalGet(`${EXPO_PUBLIC_BACKEND_URL}/api/projects`);
+      setProjects(data.projects);
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error('Error fetching projects:', error);
       Alert.alert('Error', 'Failed to load projects');
@@ -50,6 +57,22 @@ export default function HistoryScreen() {
     fetchProjects();
   };
 
+  const fetchMoreProjects = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(`${EXPO_PUBLIC_BACKEND_URL}/api/projects`, {
+        params: { before: nextCursor },
+      });
+      setProjects((prev) => [...prev, ...response.data.projects]);
+      setNextCursor(response.data.next_cursor || null);
+    } catch (error) {
+      console.error('Error fetching more projects:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const deleteProject = async (projectId: string) => {
     Alert.alert(
       'Delete Project',
@@ -94,14 +117,10 @@ export default function HistoryScreen() {
       activeOpacity={0.9}
     >
       <View style={styles.imageContainer}>
-        {item.thumbnail_base64 || item.image_base64 ? (
+        {item.thumbnail_url || item.thumbnail_base64 || item.image_base64 ? (
           <Image
             source={{ 
-              uri: (() => {
-                const img = item.thumbnail_base64 || item.image_base64;
-                if (!img) return undefined;
-                return img.startsWith('data:') ? img : `data:image/jpeg;base64,${img}`;
-              })() 
+              uri: resolveImageUri(item.thumbnail_url || item.thumbnail_base64 || item.image_base64)
             }}
             style={styles.projectImage}
           />
@@ -185,6 +204,9 @@ export default function HistoryScreen() {
         ListEmptyComponent={renderEmpty}
         refreshing={refreshing}
         onRefresh={handleRefresh}
+        onEndReached={fetchMoreProjects}
+        onEndReachedThreshold={0.5}
+        ListFooterComponent={loadingMore ? <ActivityIndicator style={{ marginVertical: 16 }} color={HOUZZ_GREEN} /> : null}
       />
     </SafeAreaView>
   );
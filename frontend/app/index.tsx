@@ -4,7 +4,8 @@ import { useRouter } from 'expo-router';
 import { SafeAreaView } from 'react-native-safe-area-context';
 import { MaterialIcons, FontAwesome5, Ionicons } from '@expo/vector-icons';
 import { LinearGradient } from 'expo-linear-gradient';
-import axios from 'axios';
+import { resolveImageUri } from '../utils/imageUri';
+import { conditionalGet } from '../utils/conditionalGet';
 
 const { width } = Dimensions.get('window');
 const EXPO_PUBLIC_BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
@@ -23,9 +24,11 @@ export default function HomeScreen() {
   const fetchRecentProjects = async () => {
     try {
       // Fetch only first 5 for the carousel
-      const response = await axios.get(`${EXPO_PUBLIC_BACKEND_URL}/api/projects`);
-      if (response.data && response.data.projects) {
-        setRecentProjects(response.data.projects.slice(0, 5));
+      const data = await conditionalGet(`${EXPO_PUBLIC_BACKEND_URL}/api/projects`, {
+        params: { limit: 5 },
+      });
+      if (data && data.projects) {
+        setRecentProjects(data.projects.slice(0, 5));
       }
     } catch (error) {
       console.log("Could not fetch recent projects for home screen", error);
@@ -38,7 +41,7 @@ export default function HomeScreen() {
       onPress={() => router.push({ pathname: '/project', params: { projectId: item.id } })}
     >
       <Image 
-        source={{ uri: item.thumbnail_base64 || (item.image_base64.startsWith('data:') ? item.image_base64 : `data:image/jpeg;base64,${item.image_base64}`) }} 
+        source={{ uri: resolveImageUri(item.thumbnail_url || item.thumbnail_base64 || item.image_base64) }} 
         style={styles.projectCardImage} 
       />
       <View style={styles.projectCardOverlay}>
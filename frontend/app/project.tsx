@@ -5,6 +5,8 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import { MaterialIcons } from '@expo/vector-icons';
 import axios from 'axios';
 import StepImageSlideshow from '../components/StepImageSlideshow';
+import { resolveImageUri } from '../utils/imageUri';
+import { conditionalGet } from '../utils/conditionalGet';
 
 const EXPO_PUBLIC_BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
 const HOUZZ_GREEN = '#3dae2b';
@@ -25,6 +27,9 @@ interface InstructionStep {
   warning?: string;
   image_hint?: string;
   generated_images?: string[];
+  generated_image_urls?: string[];
+  has_images?: boolean;
+  images_generating?: boolean;
 }
 
 interface Project {
@@ -35,6 +40,7 @@ interface Project {
   skill_level_name: string;
   estimated_time: string;
   image_base64: string;
+  image_url?: string;
   hardware_identified: string;
   issue_type: string;
   safety_warnings: string[];
@@ -56,10 +62,8 @@ export default function ProjectScreen() {
 
   const fetchProject = async () => {
     try {
-      const response = await axios.get(
-        `${EXPO_PUBLIC_BACKEND_URL}/api/projects/${projectId}`
-      );
-      setProject(response.data.project);
+      const data = await conditionalGet(`${EXPO_PUBLIC_BACKEND_URL}/api/projects/${projectId}`);
+      setProject(data.project);
     } catch (error) {
       console.error('Error fetching project:', error);
       Alert.alert('Error', 'Failed to load project details');
@@ -71,10 +75,9 @@ export default function ProjectScreen() {
   const toggleItemOwnership = async (itemId: string, currentStatus: boolean) => {
     try {
       await axios.post(
-        `${EXPO_PUBLIC_BACKEND_URL}/api/projects/${projectId}/toggle-item`,
+        `${EXPO_PUBLIC_BACKEND_URL}/api/projects/${projectId}/items`,
         {
-          item_id: itemId,
-          owned: !currentStatus
+          items: [{ item_id: itemId, owned: !currentStatus }]
         }
       );
       
@@ -137,7 +140,7 @@ export default function ProjectScreen() {
         {/* Project Image Header */}
         <View style={styles.imageHeaderContainer}>
             <Image
-            source={{ uri: project.image_base64.startsWith('data:') ? project.image_base64 : `data:image/jpeg;base64,${project.image_base64}` }}
+            source={{ uri: resolveImageUri(project.image_url || project.image_base64, 800) }}
             style={styles.projectImageHeader}
             resizeMode="cover"
             />
@@ -255,6 +258,9 @@ export default function ProjectScreen() {
                         projectId={project.id}
                         stepId={step.id}
                         stepTitle={step.title}
+                        initialImages={step.generated_image_urls}
+                        hasImages={step.has_images}
+                        imagesGenerating={step.images_generating}
                       />
                       
                       <Text style={styles.stepDescription}>{step.description}</Text>
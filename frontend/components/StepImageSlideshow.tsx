@@ -12,15 +12,20 @@ import {
 } from 'react-native';
 import { MaterialIcons } from '@expo/vector-icons';
 import axios from 'axios';
+import { resolveImageUri } from '../utils/imageUri';
 
 const { width: SCREEN_WIDTH } = Dimensions.get('window');
 const HOUZZ_GREEN = '#3dae2b';
 const EXPO_PUBLIC_BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+const JOB_POLL_INTERVAL_MS = 2000;
 
 interface StepImageSlideshowProps {
   projectId: string;
   stepId: string;
   stepTitle: string;
+  initialImages?: string[];
+  hasImages?: boolean;
+  imagesGenerating?: boolean;
   onImageLoad?: () => void;
 }
 
@@ -28,6 +33,9 @@ export default function StepImageSlideshow({
   projectId, 
   stepId, 
   stepTitle,
+  initialImages,
+  hasImages,
+  imagesGenerating,
   onImageLoad 
 }: StepImageSlideshowProps) {
   const [images, setImages] = useState<string[]>([]);
@@ -38,9 +46,25 @@ export default function StepImageSlideshow({
   const [hasChecked, setHasChecked] = useState(false);
   const fadeAnim = useRef(new Animated.Value(1)).current;
 
-  // Check for existing images on mount
+  const mounted = useRef(true);
+
+  useEffect(() => {
+    mounted.current = true;
+    return () => {
+      mounted.current = false;
+    };
+  }, []);
+
+  // Check for existing images on mount, unless the project payload already says
   useEffect(() => {
-    checkExistingImages();
+    if (initialImages && initialImages.length > 0) {
+      setImages(initialImages);
+      setHasChecked(true);
+    } else if (hasImages === false && !imagesGenerating) {
+      setHasChecked(true);
+    } else {
+      checkExistingImages();
+    }
   }, [projectId, stepId]);
 
   const checkExistingImages = async () => {
@@ -52,6 +76,9 @@ export default function StepImageSlideshow({
       if (response.data.success && response.data.images.length > 0) {
         setImages(response.data.images);
         onImageLoad?.();
+      } else if (response.data.status === 'generating') {
+        // A job is already running for this step (e.g. started before the app was closed)
+        generateImages();
       }
     } catch (err) {
       // No existing images, that's okay
@@ -61,26 +88,58 @@ export default function StepImageSlideshow({
     }
   };
 
+  // Poll the background job until it finishes; it keeps running server-side if we leave
+  const waitForJob = async (jobId: string) => {
+    while (mounted.current) {
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      const response = await axios.get(`${EXPO_PUBLIC_BACKEND_URL}/api/jobs/${jobId}`);
+      if (response.data.status === 'succeeded' || response.data.status === 'failed') {
+        return response.data;
+      }
+    }
+    return null;
+  };
+
   const generateImages = async () => {
     setGenerating(true);
     setError(null);
     
     try {
       const response = await axios.post(
-        `${EXPO_PUBLIC_BACKEND_URL}/api/projects/${projectId}/steps/${stepId}/generate-images`
+        `${EXPO_PUBLIC_BACKEND_URL}/api/projects/${projectId}/steps/${stepId}/generate-images`,
+        null,
+        { params: { wait: false } }
       );
       
-      if (response.data.success && response.data.images.length > 0) {
-        setImages(response.data.images);
+      let { success, images: generated, message } = response.data;
+      if (!success && response.data.job_id) {
+        const job = await waitForJob(response.data.job_id);
+        if (!job) {
+          return;
+        }
+        success = job.status === 'succeeded';
+        generated = job.images;
+        message = job.error;
+      }
+
+      if (!mounted.current) {
+        return;
+      }
+      if (success && generated.length > 0) {
+        setImages(generated);
         onImageLoad?.();
       } else {
-        setError(response.data.message || 'Failed to generate image');
+        setError(message || 'Failed to generate image');
       }
     } catch (err: any) {
       console.error('Image generation error:', err);
-      setError(err.response?.data?.detail || 'Failed to generate image');
+      if (mounted.current) {
+        setError(err.response?.data?.detail || 'Failed to generate image');
+      }
     } finally {
-      setGenerating(false);
+      if (mounted.current) {
+        setGenerating(false);
+      }
     }
   };
 
@@ -151,7 +210,7 @@ export default function StepImageSlideshow({
     <View style={styles.slideshowContainer}>
       <Animated.View style={[styles.imageWrapper, { opacity: fadeAnim }]}>
         <Image
-          source={{ uri: images[currentIndex] }}
+          source={{ uri: resolveImageUri(images[currentIndex]) }}
           style={styles.slideImage}
           resizeMode="cover"
         />
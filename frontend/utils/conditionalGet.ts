@@ -0,0 +1,29 @@
+import axios, { AxiosRequestConfig } from 'axios';
+
+// Last ETagged body per URL + params, kept for the lifetime of the app
+const responses = new Map<string, { etag: string; data: any }>();
+
+/**
+ * GET that revalidates with If-None-Match and reuses the previous body on 304.
+ *
+ * Used for project list/detail reads, which the backend versions with ETags:
+ * refetching an unchanged screen then costs an empty 304 instead of a payload.
+ */
+export async function conditionalGet<T = any>(url: string, config: AxiosRequestConfig = {}): Promise<T> {
+  const key = `${url}?${JSON.stringify(config.params || {})}`;
+  const previous = responses.get(key);
+  const response = await axios.get(url, {
+    ...config,
+    headers: { ...(config.headers || {}), ...(previous ? { 'If-None-Match': previous.etag } : {}) },
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+  });
+
+  if (response.status === 304 && previous) {
+    return previous.data;
+  }
+  const etag = response.headers['etag'];
+  if (etag) {
+    responses.set(key, { etag, data: response.data });
+  }
+  return response.data;
+}
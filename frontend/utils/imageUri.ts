@@ -0,0 +1,19 @@
+const EXPO_PUBLIC_BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+
+/**
+ * Turn an image reference from the API into a URI <Image> can load.
+ *
+ * - `/api/images/...` paths are served by the backend (cacheable, resizable via `width`)
+ * - absolute and data: URLs pass through unchanged
+ * - bare base64 strings (older projects) become JPEG data URLs
+ */
+export function resolveImageUri(image?: string | null, width?: number): string | undefined {
+  if (!image) return undefined;
+  if (image.startsWith('data:')) return image;
+  if (image.startsWith('/') || /^https?:\/\//.test(image)) {
+    const url = image.startsWith('/') ? `${EXPO_PUBLIC_BACKEND_URL}${image}` : image;
+    if (!width || !url.includes('/api/images/')) return url;
+    return `${url}${url.includes('?') ? '&' : '?'}w=${width}`;
+  }
+  return `data:image/jpeg;base64,${image}`;
+}
@@ -0,0 +1,104 @@
+import asyncio
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from server import CompressionMiddleware  # noqa: E402
+
+BODY = b'{"projects": [' + b'{"title": "Fix the leaking faucet"}, ' * 100 + b'{}]}'
+
+
+def make_app(body=BODY, content_type=b"application/json", headers=()):
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        })
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+    return app
+
+
+def call(app, accept_encoding=None):
+    """Run one GET through the ASGI app; returns (headers dict, body)"""
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding is not None else []
+    scope = {"type": "http", "method": "GET", "path": "/api/projects", "headers": headers}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, body = messages[0], b"".join(m.get("body", b"") for m in messages[1:])
+    return {k.decode(): v.decode() for k, v in start["headers"]}, body
+
+
+def middleware(app=None, min_size=500):
+    return CompressionMiddleware(app or make_app(), encodings=["gzip"], min_size=min_size)
+
+
+def test_gzip_round_trip():
+    headers, body = call(middleware(), "gzip, deflate")
+    assert headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(body) < len(BODY)
+    assert gzip.decompress(body) == BODY
+
+
+def test_small_body_passes_through():
+    headers, body = call(middleware(make_app(b'{"ok": true}')), "gzip")
+    assert "content-encoding" not in headers
+    assert body == b'{"ok": true}'
+
+
+def test_min_size_threshold():
+    headers, _ = call(middleware(min_size=len(BODY) + 1), "gzip")
+    assert "content-encoding" not in headers
+    headers, _ = call(middleware(min_size=len(BODY)), "gzip")
+    assert headers["content-encoding"] == "gzip"
+
+
+def test_image_passes_through():
+    image = b"\x89PNG" + b"\x00" * 5000
+    headers, body = call(middleware(make_app(image, b"image/png")), "gzip")
+    assert "content-encoding" not in headers
+    assert body == image
+
+
+def test_no_accept_encoding_passes_through():
+    headers, body = call(middleware(), None)
+    assert "content-encoding" not in headers
+    assert body == BODY
+
+
+def test_q_zero_is_not_accepted():
+    for accept in ("gzip;q=0", "gzip; q=0.0", "gzip;q=0.000, identity", "br, gzip;q=0"):
+        headers, body = call(middleware(), accept)
+        assert "content-encoding" not in headers, accept
+        assert body == BODY
+
+
+def test_nonzero_q_is_accepted():
+    headers, _ = call(middleware(), "identity;q=1, gzip;q=0.5")
+    assert headers["content-encoding"] == "gzip"
+
+
+def test_etag_weakened_and_vary_merged():
+    app = make_app(headers=[(b"etag", b'"v7"'), (b"vary", b"Origin")])
+    headers, _ = call(middleware(app), "gzip")
+    assert headers["etag"] == 'W/"v7"'
+    assert headers["vary"] == "Origin, Accept-Encoding"
+
+
+def test_identity_response_keeps_strong_etag():
+    app = make_app(headers=[(b"etag", b'"v7"')])
+    headers, _ = call(middleware(app), "identity")
+    assert headers["etag"] == '"v7"'
@@ -0,0 +1,70 @@
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from server import PartialJSONScanner  # noqa: E402
+
+DIAGNOSIS = {
+    "title": "Replace the \"P-trap\" under the kitchen sink",
+    "description": "Leak at the slip nut, {not} a [cracked] pipe: tighten, then replace.\nBackslash \\ test",
+    "skill_level": 2,
+    "estimated_time": "1-2 hours",
+    "hardware_identified": "1-1/2\" PVC P-trap, Oatey",
+    "issue_type": "Plumbing leak",
+    "steps": [
+        {"step_number": 1, "title": "Shut off water", "description": "Close both valves, then open the tap.",
+         "warning": None, "image_hint": "valves under sink"},
+        {"step_number": 2, "title": "Remove the trap", "description": "If the nut is stuck, use pliers; else by hand.",
+         "warning": "Bucket first, water {will} spill", "image_hint": None},
+        {"step_number": 3, "title": "Fit the new trap", "description": "Hand-tight plus ¼ turn ✓",
+         "warning": None, "image_hint": "nuts, washers, [bevel] up"},
+    ],
+    "materials": [{"name": "P-trap kit", "estimated_cost": "$8-12"}, {"name": "Plumber's tape", "estimated_cost": None}],
+    "tools": [],
+    "safety_warnings": ["Wear gloves", "Don't overtighten, PVC cracks"],
+    "visual_context": "White PVC trap, chrome tailpiece",
+}
+
+
+def expected_events():
+    events = []
+    for key, value in DIAGNOSIS.items():
+        if isinstance(value, list):
+            events += [("item", key, item) for item in value]
+        events.append(("field", key, value))
+    return events
+
+
+def scan(text, sizes):
+    scanner = PartialJSONScanner()
+    events, pos = [], 0
+    for size in sizes:
+        events += scanner.feed(text[pos:pos + size])
+        pos += size
+    events += scanner.feed(text[pos:])
+    return events
+
+
+def test_random_chunks():
+    text = json.dumps(DIAGNOSIS, ensure_ascii=False, indent=2)
+    for seed in range(200):
+        rng = random.Random(seed)
+        sizes = [rng.randint(1, 40) for _ in range(len(text))]
+        assert scan(text, sizes) == expected_events(), f"seed {seed}"
+
+
+def test_one_character_at_a_time_compact():
+    text = json.dumps(DIAGNOSIS, separators=(",", ":"))
+    assert scan(text, [1] * len(text)) == expected_events()
+
+
+def test_events_arrive_before_the_document_ends():
+    text = json.dumps(DIAGNOSIS)
+    cut = text.index('"materials"')
+    events = PartialJSONScanner().feed(text[:cut])
+    assert ("field", "title", DIAGNOSIS["title"]) in events
+    assert [e[2] for e in events if e[:2] == ("item", "steps")] == DIAGNOSIS["steps"]
+    assert not any(e[1] == "materials" for e in events)